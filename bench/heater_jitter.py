@@ -0,0 +1,49 @@
+#!/usr/bin/python
+'''Measures the edge timing of the heater output driver.
+
+Runs HeaterOutput through a series of short time-proportioning windows with
+random duty cycles and reports how late the on/off edges were switched
+compared to their intended time, plus the CPU time used.
+
+Usage: python bench/heater_jitter.py [--windows 50] [--window 0.2]
+'''
+import os
+import sys
+import time
+import random
+import argparse
+
+script_dir = os.path.dirname(os.path.realpath(__file__))
+root_dir = os.path.dirname(script_dir)
+sys.path.insert(0, root_dir)
+sys.path.insert(0, os.path.join(root_dir, 'lib'))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--windows", type=int, default=50)
+    parser.add_argument("--window", type=float, default=0.2)
+    args = parser.parse_args()
+
+    import logging
+    logging.disable(logging.CRITICAL)
+    from heater import HeaterOutput
+
+    output = HeaterOutput(history=2 * args.windows)
+    cpu_start = time.process_time()
+    start = time.monotonic()
+    for i in range(args.windows):
+        window_start = start + i * args.window
+        output.start_window(random.uniform(0.1, 0.9) * args.window, args.window, window_start)
+        time.sleep(max(0, window_start + args.window - time.monotonic()))
+    cpu = time.process_time() - cpu_start
+    output.off()
+
+    jitter = output.jitter()
+    print("%d edges in %d windows of %.3fs" % (jitter['count'], args.windows, args.window))
+    print("edge lateness: mean %.3f ms, max %.3f ms" % (jitter['mean'] * 1000, jitter['max'] * 1000))
+    print("cpu: %.3f s for %.1f s of output" % (cpu, args.windows * args.window))
+
+
+if __name__ == "__main__":
+    main()
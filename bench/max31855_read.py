@@ -0,0 +1,64 @@
+#!/usr/bin/python
+'''Compares the bit-banged and the kernel SPI read paths of the MAX31855 driver.
+
+Both paths talk to the same simulated chip from the in-memory hal backend:
+on a MemoryGPIO the ShiftRegister puts its 32 bit frame on the data pin
+clock by clock, through a MemorySPI it hands it over in one transfer.
+Nothing waits for hardware, so the numbers are the Python cost per sample
+the sensor thread pays on top of the bus itself.
+
+Usage: python bench/max31855_read.py [--reads 20000]
+'''
+import os
+import sys
+import time
+import argparse
+
+script_dir = os.path.dirname(os.path.realpath(__file__))
+root_dir = os.path.dirname(script_dir)
+sys.path.insert(0, root_dir)
+sys.path.insert(0, os.path.join(root_dir, 'lib'))
+
+
+def frame(tc, rj):
+    '''32 bit MAX31855 frame for thermocouple and reference junction temperatures (celsius).'''
+    return ((int(round(tc / 0.25)) & 0x3FFF) << 18) | ((int(round(rj / 0.0625)) & 0xFFF) << 4)
+
+
+def measure(thermocouple, reads):
+    latencies = []
+    start = time.perf_counter()
+    for i in range(reads):
+        t = time.perf_counter()
+        thermocouple.get()
+        latencies.append(time.perf_counter() - t)
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return reads / elapsed, latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--reads", type=int, default=20000)
+    args = parser.parse_args()
+
+    from hal import MemoryGPIO, MemorySPI, ShiftRegister
+    from max31855 import MAX31855
+
+    gpio = MemoryGPIO(history=1)
+    # pins off the hardware SPI ports, so the driver bitbangs
+    chip = gpio.attach(ShiftRegister(27, 22, 17, frame=frame(1000.25, 25.5)))
+    paths = [
+        ("bitbang", MAX31855(27, 22, 17, gpio=gpio)),
+        ("spidev", MAX31855(27, 22, 17, gpio=gpio, spi=MemorySPI(chip))),
+    ]
+
+    print("%d reads per path" % args.reads)
+    print("%-8s %10s %12s %12s %8s" % ("path", "reads/s", "median us", "p99 us", "temp"))
+    for name, thermocouple in paths:
+        rate, median, p99 = measure(thermocouple, args.reads)
+        print("%-8s %10.0f %12.1f %12.1f %8.2f" % (name, rate, median * 1e6, p99 * 1e6, thermocouple.get()))
+
+
+if __name__ == "__main__":
+    main()
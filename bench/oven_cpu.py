@@ -0,0 +1,111 @@
+#!/usr/bin/python
+'''Measures the CPU time the oven control loop burns per hour of firing.
+
+Each variant runs in its own process against the simulated kiln (or the real
+sensor on a Pi) for a fixed wall-clock window, once idle and once running a
+profile, and the CPU time of the process is scaled to one hour:
+
+  busy      - the old busy-spin loop: every pass recomputes the runtime,
+              writes the heater pin from the pid duty (set_heat2) and
+              updates the segment, as Oven.run did before
+  scheduled - Oven.run, which sleeps until the next deadline
+
+Usage: python bench/oven_cpu.py [--seconds 20] [--profile bisque]
+'''
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+script_dir = os.path.dirname(os.path.realpath(__file__))
+root_dir = os.path.dirname(script_dir)
+sys.path.insert(0, root_dir)
+sys.path.insert(0, os.path.join(root_dir, 'lib'))
+profile_path = os.path.join(root_dir, "storage", "profiles")
+
+VARIANTS = ["busy", "scheduled"]
+
+
+def load_profile(name):
+    for filename in os.listdir(profile_path):
+        with open(os.path.join(profile_path, filename), 'r') as f:
+            obj = json.load(f)
+        if obj["name"] == name:
+            return json.dumps(obj)
+    raise SystemExit("no profile named %s" % name)
+
+
+def measure(variant, seconds, profile_name):
+    import logging
+    logging.disable(logging.CRITICAL)
+
+    from oven2 import Oven, Profile, pid_cycle
+
+    if variant == "busy":
+        class BusyOven(Oven):
+            def run(self):
+                # the body of the original Oven.run on today's clock, pid and output
+                duty = 0
+                while True:
+                    if self.state == Oven.STATE_RUNNING:
+                        now = self.clock.millis()
+                        self.runtime = self.clock.time() - self.start_time
+                        temperature = self.temp_sensor.temperature
+                        if now - self.profile.pidStart >= pid_cycle:
+                            self.profile.pidStart = now
+                            if self.profile.type == "profile":
+                                self.target = self.profile.get_target_temperature(self.runtime, temperature)
+                            else:
+                                self.target = self.profile.update_pid(temperature, now)
+                            self.pid.setpoint = self.target
+                            duty = self.pid(temperature)
+                        # set_heat2
+                        self.output.write(1 if duty * 1000 >= now - self.profile.pidStart else 0)
+                        if self.profile.type == "ramp-hold":
+                            self.profile.update_seg(temperature, now)
+                        if self.profile.finished():
+                            self.reset()
+        oven_class = BusyOven
+    else:
+        oven_class = Oven
+
+    oven = oven_class()
+    result = {}
+    for phase in ["idle", "running"]:
+        if phase == "running":
+            oven.run_profile(Profile(load_profile(profile_name)))
+        cpu_start = time.process_time()
+        wall_start = time.time()
+        time.sleep(seconds)
+        cpu = time.process_time() - cpu_start
+        wall = time.time() - wall_start
+        result[phase] = cpu / wall * 3600
+    print(json.dumps(result))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--profile", default="5hoursSC-20")
+    parser.add_argument("--variant", choices=VARIANTS)
+    args = parser.parse_args()
+
+    if args.variant:
+        measure(args.variant, args.seconds, args.profile)
+        return
+
+    print("CPU seconds per hour of firing (%.0fs sample, profile %s)" % (args.seconds, args.profile))
+    print("%-10s %10s %10s" % ("variant", "idle", "running"))
+    for variant in VARIANTS:
+        out = subprocess.check_output([sys.executable, os.path.realpath(__file__),
+                                       "--variant", variant,
+                                       "--seconds", str(args.seconds),
+                                       "--profile", args.profile])
+        result = json.loads(out.decode().strip().splitlines()[-1])
+        print("%-10s %10.1f %10.1f" % (variant, result["idle"], result["running"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/python
+'''Measures status fan-out through the pub/sub hub to many websocket clients.
+
+Every client is a real ovenWatcher.Subscriber on a fake socket that only
+notes when a message reaches it. A plain thread publishes like the oven
+watcher does while the gevent hub of the main thread drains the queues,
+so the latency covers publish(), the async wakeups and the writes. One
+client in ten is subscribed to a second topic, which is published to in
+between to keep the copy-on-write snapshots honest.
+
+Usage: python bench/pubsub_fanout.py [--messages 100] [--interval 0.02] [--clients 10 100 1000]
+'''
+import os
+import sys
+import time
+import argparse
+import threading
+
+script_dir = os.path.dirname(os.path.realpath(__file__))
+root_dir = os.path.dirname(script_dir)
+sys.path.insert(0, root_dir)
+sys.path.insert(0, os.path.join(root_dir, 'lib'))
+
+
+class FakeSocket(object):
+    def __init__(self, received):
+        self.received = received
+
+    def send(self, message):
+        self.received.append((message, time.perf_counter()))
+
+    def close(self):
+        pass
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def run(clients, messages, interval):
+    import gevent
+    from pubsub import Hub, STATUS, EVENTS
+    from ovenWatcher import Subscriber
+
+    hub = Hub()
+    received = []
+    for i in range(clients):
+        subscriber = Subscriber(FakeSocket(received))
+        hub.subscribe(STATUS, subscriber)
+        if i % 10 == 0:
+            hub.subscribe(EVENTS, subscriber)
+
+    published = {}
+    publish_cost = []
+
+    def publisher():
+        for seq in range(messages):
+            message = '{"type": "delta", "seq": %d}' % seq
+            t = time.perf_counter()
+            published[message] = t
+            hub.publish(STATUS, message)
+            publish_cost.append(time.perf_counter() - t)
+            hub.publish(EVENTS, '{"type": "event"}')
+            time.sleep(interval)
+
+    thread = threading.Thread(target=publisher)
+    thread.start()
+    while thread.is_alive():
+        gevent.sleep(0.001)
+    gevent.sleep(0.1)
+
+    # latency of every delivery, and of the last client per message
+    latencies = []
+    last = {}
+    for message, t in received:
+        if message in published:
+            latency = t - published[message]
+            latencies.append(latency)
+            last[message] = max(last.get(message, 0.0), latency)
+    for subscriber in hub.subscribers(STATUS):
+        subscriber.close()
+    gevent.sleep(0.01)
+    return (len(latencies) / float(clients * messages), percentile(publish_cost, 0.5),
+            percentile(latencies, 0.5), percentile(latencies, 0.99), percentile(list(last.values()), 0.99))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=100)
+    parser.add_argument("--interval", type=float, default=0.02)
+    parser.add_argument("--clients", type=int, nargs="+", default=[10, 100, 1000])
+    args = parser.parse_args()
+
+    print("%d messages, %g s apart" % (args.messages, args.interval))
+    print("%8s %10s %12s %12s %12s %12s" % ("clients", "delivered", "publish us", "median ms", "p99 ms", "last p99 ms"))
+    for clients in args.clients:
+        delivered, cost, median, p99, last = run(clients, args.messages, args.interval)
+        print("%8d %9.1f%% %12.1f %12.2f %12.2f %12.2f" % (clients, delivered * 100, cost * 1e6, median * 1e3,
+                                                            p99 * 1e3, last * 1e3))
+
+
+if __name__ == "__main__":
+    main()
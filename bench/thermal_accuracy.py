@@ -0,0 +1,57 @@
+#!/usr/bin/python
+'''Accuracy vs speed of the Euler and the exact (zero-order-hold) thermal model updates.
+
+The heater is switched randomly on or off for whole pid cycles over a firing
+of --hours. Because the heater level is constant within each cycle the exact
+update at the pid cycle length is the true solution of the model; every
+method is compared against it at the cycle boundaries.
+
+Usage: python bench/thermal_accuracy.py [--hours 2]
+'''
+import os
+import sys
+import time
+import argparse
+
+script_dir = os.path.dirname(os.path.realpath(__file__))
+root_dir = os.path.dirname(script_dir)
+sys.path.insert(0, root_dir)
+sys.path.insert(0, os.path.join(root_dir, 'lib'))
+
+# (method, step length in seconds), steps must divide the pid cycle
+RUNS = [("euler", 0.01), ("euler", 0.05), ("euler", 0.5), ("euler", 2.5), ("euler", 7.5),
+        ("exact", 0.5), ("exact", 7.5)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--hours", type=float, default=2)
+    args = parser.parse_args()
+
+    import logging
+    logging.disable(logging.CRITICAL)
+    import numpy as np
+    import oven2
+    from thermal import simulate_batch
+
+    cycle = oven2.pid_cycle / 1000.0
+    n_cycles = int(args.hours * 3600 / cycle)
+    rng = np.random.default_rng(2)
+    levels = (rng.random(n_cycles) < 0.7).astype(float)
+
+    reference, _ = simulate_batch(levels, cycle, method="exact")
+    reference = reference[0]
+
+    print("%.1f h firing, %d pid cycles of %.1f s" % (args.hours, n_cycles, cycle))
+    print("%-6s %8s %10s %16s" % ("method", "step s", "max err", "ms per sim hour"))
+    for method, dt in RUNS:
+        per_cycle = int(round(cycle / dt))
+        start = time.perf_counter()
+        t_oven, _ = simulate_batch(np.repeat(levels, per_cycle), dt, method=method)
+        elapsed = time.perf_counter() - start
+        error = np.abs(t_oven[0, ::per_cycle] - reference).max()
+        print("%-6s %8.2f %10.4f %16.2f" % (method, dt, error, elapsed / args.hours * 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+#!/usr/bin/python
+'''Compares scenario throughput of the scalar thermal model and the NumPy batch simulator.
+
+Every scenario is a firing of --hours with its own random heater duty
+sequence and heater power. The scalar path steps TempSensorSimulate once per
+scenario, switching a HeaterOutput on an in-memory GPIO it follows, the
+batch paths integrate all scenarios in one simulate_batch call with the
+Euler and the exact update. The scalar end temperatures are checked against
+the exact batch.
+
+Usage: python bench/thermal_batch.py [--scenarios 200] [--hours 9] [--dt 0.5]
+'''
+import os
+import sys
+import time
+import argparse
+
+script_dir = os.path.dirname(os.path.realpath(__file__))
+root_dir = os.path.dirname(script_dir)
+sys.path.insert(0, root_dir)
+sys.path.insert(0, os.path.join(root_dir, 'lib'))
+
+
+class Oven(object):
+    '''The part of oven2.Oven that TempSensorSimulate follows: its heater output.'''
+
+    def __init__(self, clock):
+        from hal import MemoryGPIO
+        from heater import HeaterOutput
+        self.output = HeaterOutput(clock=clock, threaded=False, gpio=MemoryGPIO(clock, history=1))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scenarios", type=int, default=200)
+    parser.add_argument("--hours", type=float, default=9)
+    parser.add_argument("--dt", type=float, default=0.5)
+    parser.add_argument("--scalar", type=int, default=5, help="scenarios to time on the scalar path")
+    args = parser.parse_args()
+
+    import logging
+    logging.disable(logging.CRITICAL)
+    import numpy as np
+    from clock import VirtualClock
+    from oven2 import TempSensorSimulate
+    from thermal import simulate_batch, model_params
+
+    n_steps = int(args.hours * 3600 / args.dt)
+    rng = np.random.default_rng(1)
+    duty = (rng.random((args.scenarios, n_steps)) < rng.random((args.scenarios, 1))).astype(float)
+    p_heat = rng.uniform(1000, 3000, args.scenarios)
+
+    scalar_scenarios = min(args.scalar, args.scenarios)
+    scalar_end = []
+    start = time.perf_counter()
+    for i in range(scalar_scenarios):
+        clock = VirtualClock()
+        oven = Oven(clock)
+        sensor = TempSensorSimulate(oven, args.dt, args.dt, clock, model_params(p_heat=p_heat[i]))
+        for level in duty[i]:
+            oven.output.hold(level)
+            clock.advance(args.dt)
+            sensor.integrate_to(clock.time())
+        scalar_end.append(sensor.t)
+    scalar = (time.perf_counter() - start) / scalar_scenarios
+
+    print("%d scenarios of %.1f h, %d steps of %.2f s" % (args.scenarios, args.hours, n_steps, args.dt))
+    print("%-14s %12s %14s" % ("path", "ms/scenario", "scenarios/s"))
+    print("%-14s %12.2f %14.1f" % ("scalar", scalar * 1000, 1 / scalar))
+    for method in ["euler", "exact"]:
+        start = time.perf_counter()
+        t_oven, t_heat = simulate_batch(duty, args.dt, model_params(p_heat=p_heat), method=method)
+        batch = (time.perf_counter() - start) / args.scenarios
+        print("%-14s %12.2f %14.1f" % ("batch " + method, batch * 1000, 1 / batch))
+    deviation = np.max(np.abs(np.array(scalar_end) - t_oven[:scalar_scenarios, -1]))
+    print("scalar vs batch exact end temperature: max deviation %.2g degrees" % deviation)
+
+
+if __name__ == "__main__":
+    main()
@@ -25,6 +25,13 @@ currency_type   = "CAD"   # Currency Symbol to show when calculating cost to run
 #   These were tested on a Pi B Rev2 but of course you
 #   can use whichever GPIO you prefer/have available.
 
+### Hardware backend for GPIO and SPI:
+#   "rpi"    - RPi.GPIO and the kernel spidev devices
+#   "memory" - nothing touches hardware, pin edges are recorded (hal.MemoryGPIO);
+#              lets the daemon run on any Linux box
+#   "auto"   - "rpi" if RPi.GPIO is installed, "memory" otherwise
+hal = "auto"
+
 ### Outputs
 gpio_heat = 23  # Switches zero-cross solid-state-relay (was 11 initially)
 # I don't use the following two imputs for ceramics, but there here if you need them:
@@ -37,17 +44,25 @@ heater_invert = 0 # switches the polarity of the heater control (was 0 initially
 gpio_door = 18 # another one I don't use, but might find useful one day
 
 ### Thermocouple Adapter selection:
-#   max31855 - bitbang SPI interface
+#   max31855 - bitbang SPI interface, kernel spidev if the pins below are a hardware SPI port
 #   max31855spi - kernel SPI interface
 #   max6675 - bitbang SPI interface
 max31855 = 1
 max6675 = 0
 max31855spi = 0 # if you use this one, you MUST reassign the default GPIO pins
+### max31855: correct the chip's linear type K approximation (off by ~20 deg C at
+### cone 6) with the NIST ITS-90 tables in lib/typek.py
+max31855_linearize = 1
 
 ### Thermocouple Connection (using bitbang interfaces)
+###   max31855 on SPI0 (cs 8 or 7, clock 11, data 9) reads via /dev/spidev0.x instead
 gpio_sensor_cs = 27
 gpio_sensor_clock = 22
 gpio_sensor_data = 17
+### More MAX31855 on the same clock and data pins, each with its own chip select,
+### e.g. [("top", 5), ("bottom", 6)]. All are read in one pass and reported, the
+### one on gpio_sensor_cs ("main") controls the kiln.
+gpio_sensor_channels = []
 
 ### Thermocouple SPI Connection (using adafrut drivers + kernel SPI interface)
 spi_sensor_chip_id = 0
@@ -56,6 +71,44 @@ spi_sensor_chip_id = 0
 sensor_time_wait = 7
 # was .5 for solder reflow
 
+### adaptive sampling (real sensors): reads stay sensor_time_wait apart while the
+### temperature moves, come faster (down to sensor_time_min) on ramps steeper than one
+### sample per sensor_resolution degrees and close to a segment transition, and slow
+### down to sensor_time_max only while the slope is below sensor_still_slope degrees
+### per hour (holds, idle). Set both bounds to sensor_time_wait to sample at a fixed rate.
+sensor_time_min = 2
+sensor_time_max = 15
+sensor_resolution = 0.5
+sensor_still_slope = 10
+
+### back-to-back reads combined into one sample, and how: "median" or "trimmed" (mean)
+### (a MAX6675 converts only every 0.22 s, its reads are spaced that far apart)
+sensor_oversample = 1
+sensor_reduce = "median"
+
+### number of timestamped samples the sensor thread keeps for slope and age checks
+sensor_history = 512
+
+### Kalman filter fusing the samples with the thermal model (the sim_* values below)
+### and the heater on-time. It reports the filtered kiln temperature, the element
+### temperature and the slope; with estimator_control the pid acts on the filtered
+### temperature, turn that on once the sim_* values fit your kiln.
+estimator = 1
+estimator_control = 0
+estimator_q_oven = 0.01 # model uncertainty, deg^2 per second
+estimator_q_heat = 1.0
+estimator_r = 1.0       # thermocouple noise and quantization, deg^2
+
+### Sensor faults: a failed read is retried sensor_retries times, sensor_retry_delay
+### seconds apart (at least one 0.22 s conversion for a MAX6675). While reads keep
+### failing the last good value is used for up to sensor_hold_max seconds, after that
+### the sensor is faulted and the heater is switched off. A run is aborted once the
+### fault lasts sensor_fault_abort seconds.
+sensor_retries = 3
+sensor_retry_delay = 0.05
+sensor_hold_max = 30
+sensor_fault_abort = 300
+
 
 ########################################################################
 #
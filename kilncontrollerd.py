@@ -31,7 +31,8 @@ script_dir = os.path.dirname(os.path.realpath(__file__))
 sys.path.insert(0, script_dir + '/lib/')
 profile_path = os.path.join(script_dir, "storage", "profiles")
 from oven2 import Oven, Profile
-from ovenWatcher import OvenWatcher
+from ovenWatcher import OvenWatcher, backlog_points
+from simulation import Simulation
 
 app = bottle.Bottle()
 oven = Oven()
@@ -76,20 +77,29 @@ def handle_control():
                     profile = Profile(profile_json)
                 oven.run_profile(profile)
                 ovenWatcher.record(profile)
+                ovenWatcher.publish_event("RUN", profile=profile.name)
             elif msgdict.get("cmd") == "SIMULATE":
                 log.info("SIMULATE command received")
                 profile_obj = msgdict.get('profile')
                 if profile_obj:
                     profile_json = json.dumps(profile_obj)
                     profile = Profile(profile_json)
-                simulated_oven = Oven(simulate=True, time_step=0.05)
-                simulation_watcher = OvenWatcher(simulated_oven)
-                simulation_watcher.add_observer(wsock)
-                # simulated_oven.run_profile(profile)
-                # simulation_watcher.record(profile)
+                simulation = Simulation(profile)
+                for chunk in simulation.chunks():
+                    wsock.send(json.dumps({'type': "simulation", 'log': chunk}))
+                    # let the other websockets breathe between chunks
+                    gevent.sleep(0)
+                wsock.send(json.dumps({'type': "simulation_done"}))
+            elif msgdict.get("cmd") == "AUTOTUNE":
+                log.info("AUTOTUNE command received")
+                oven.run_autotune(float(msgdict.get('setpoint')),
+                                  float(msgdict.get('hysteresis', 2.0)),
+                                  int(msgdict.get('cycles', 3)))
+                ovenWatcher.publish_event("AUTOTUNE")
             elif msgdict.get("cmd") == "STOP":
                 log.info("Stop command received")
                 oven.abort_run()
+                ovenWatcher.publish_event("STOP")
         except WebSocketHandler.WebSocketError:
             break
     log.info("websocket (control) closed")
@@ -157,14 +167,26 @@ def handle_config():
 @app.route('/status')
 def handle_status():
     wsock = get_websocket_from_request()
-    ovenWatcher.add_observer(wsock)
+    # the client can ask for the number of backlog points it wants to draw
+    try:
+        points = max(10, int(bottle.request.query.points))
+    except ValueError:
+        points = backlog_points
+    # ?format=binary: backlog as float32 column frames instead of JSON
+    binary = bottle.request.query.format == "binary"
+    # all writes to a status socket go through its subscriber queue
+    subscriber = ovenWatcher.add_observer(wsock, points, binary)
     log.info("websocket (status) opened")
-    while True:
+    while not subscriber.closed:
         try:
             message = wsock.receive()
-            wsock.send("Your message was: %r" % message)
-        except WebSocketHandler.WebSocketError:
+            if message is None:
+                break
+            subscriber.send("Your message was: %r" % message, coalescable=False)
+        except geventwebsocket.WebSocketError:
             break
+    subscriber.close()
+    ovenWatcher.hub.unsubscribe(subscriber)
     log.info("websocket (status) closed")
 
 
@@ -0,0 +1,68 @@
+#!/usr/bin/python
+'''Searches PID gains on the simulated kiln and prints a ranked report.
+
+Every gain set is fired against every profile in storage/profiles (or the
+ones given with --profile) through the same Oven code as the real kiln, the
+runs are spread over a process pool.
+
+Examples:
+    $ python kilntune.py --kp 0.2,0.5,1 --ki 0.05,0.1,0.2 --kd 0,0.4
+    $ python kilntune.py --random 100 --kp 0.1,2 --ki 0,0.5 --kd 0,2
+'''
+import os
+import sys
+import logging
+import argparse
+
+try:
+    sys.dont_write_bytecode = True
+    import config
+    sys.dont_write_bytecode = False
+except:
+    print("Could not import config file.")
+    print("Copy config.py.EXAMPLE to config.py and adapt it for your setup.")
+    exit(1)
+
+logging.basicConfig(level=logging.WARNING, format=config.log_format)
+
+script_dir = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, script_dir + '/lib/')
+profile_path = os.path.join(script_dir, "storage", "profiles")
+
+import tuning
+
+
+def values(text):
+    return [float(v) for v in text.split(",")]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PID gain sweep on the simulated kiln")
+    parser.add_argument("--kp", type=values, default=[config.pid_kp], help="comma separated values (or min,max with --random)")
+    parser.add_argument("--ki", type=values, default=[config.pid_ki])
+    parser.add_argument("--kd", type=values, default=[config.pid_kd])
+    parser.add_argument("--random", type=int, default=0, help="draw this many gain sets from the min,max ranges instead of a grid")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--profile", action="append", help="profile name, may be repeated (default: all)")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.random:
+        ranges = [(min(v), max(v)) for v in (args.kp, args.ki, args.kd)]
+        gain_sets = tuning.random_gains(args.random, *ranges, seed=args.seed)
+    else:
+        gain_sets = tuning.grid(args.kp, args.ki, args.kd)
+    profiles = tuning.load_profiles(profile_path, args.profile)
+    if not profiles:
+        print("No profiles found")
+        exit(1)
+
+    print("Simulating %d gain sets on %d profiles" % (len(gain_sets), len(profiles)))
+    results = tuning.sweep(gain_sets, profiles, args.workers)
+    print(tuning.report(results, args.top))
+    print("current config: kp=%s ki=%s kd=%s" % (config.pid_kp, config.pid_ki, config.pid_kd))
+
+
+if __name__ == "__main__":
+    main()
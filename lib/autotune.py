@@ -0,0 +1,106 @@
+import math
+import logging
+
+log = logging.getLogger(__name__)
+
+
+class RelayAutotune(object):
+    '''Astrom-Hagglund relay feedback experiment.
+
+    The heater is switched fully on below setpoint - hysteresis and off above
+    setpoint + hysteresis. After the kiln has settled into a limit cycle the
+    period Pu and amplitude a of the oscillation give the ultimate gain
+
+        Ku = 4 d / (pi * sqrt(a^2 - hysteresis^2))
+
+    with d half the relay swing, from which Ziegler-Nichols PID gains follow.
+    Gains are in the units of the Oven pid: output in seconds of heat per
+    pid cycle, times in seconds.
+    '''
+
+    def __init__(self, setpoint, output_high, hysteresis=2.0, cycles=3, max_time=6 * 3600):
+        '''
+        Parameters:
+        - setpoint:    temperature to oscillate around
+        - output_high: pid output for "heater on" (the pid cycle length in seconds)
+        - hysteresis:  relay dead band in degrees, should exceed the sensor noise
+        - cycles:      oscillation periods to measure after the first one
+        - max_time:    give up after this many seconds
+        '''
+        self.setpoint = setpoint
+        self.output_high = output_high
+        self.hysteresis = hysteresis
+        self.cycles = cycles
+        self.max_time = max_time
+        self.start = None
+        self.level = 1
+        # times the relay switched on, and extremes between switches
+        self.switch_on = []
+        self.peaks = []
+        self.troughs = []
+        self.extreme = None
+        self.finished = False
+        self.result = None
+        self.error = None
+
+    def update(self, now, temperature):
+        '''Feeds one sample (time in s, temperature), returns the heater level (0 or 1).'''
+        if self.finished:
+            return 0
+        if self.start is None:
+            self.start = now
+        if now - self.start > self.max_time:
+            self.fail("no stable oscillation after %d s" % self.max_time)
+            return 0
+
+        if self.level and temperature > self.setpoint + self.hysteresis:
+            # switching off ends the trough of the on phase
+            if self.extreme is not None:
+                self.troughs.append(self.extreme)
+            self.level = 0
+            self.extreme = temperature
+        elif not self.level and temperature < self.setpoint - self.hysteresis:
+            # switching on ends the peak of the off phase
+            self.peaks.append(self.extreme)
+            self.level = 1
+            self.switch_on.append(now)
+            self.extreme = temperature
+        elif self.extreme is not None:
+            if self.level:
+                self.extreme = min(self.extreme, temperature)
+            else:
+                self.extreme = max(self.extreme, temperature)
+
+        if len(self.switch_on) >= self.cycles + 2:
+            self.compute()
+        return self.level
+
+    def compute(self):
+        # skip the first period, the kiln was still heating up to the setpoint
+        periods = [b - a for a, b in zip(self.switch_on[1:], self.switch_on[2:])]
+        peaks = self.peaks[1:]
+        troughs = self.troughs[1:]
+        pu = sum(periods) / len(periods)
+        amplitude = (sum(peaks) / len(peaks) - sum(troughs) / len(troughs)) / 2.0
+        if amplitude <= self.hysteresis:
+            self.fail("oscillation amplitude %.2f within the hysteresis" % amplitude)
+            return
+        d = self.output_high / 2.0
+        ku = 4 * d / (math.pi * math.sqrt(amplitude ** 2 - self.hysteresis ** 2))
+        self.result = {
+            'ku': ku,
+            'pu': pu,
+            'amplitude': amplitude,
+            # classic Ziegler-Nichols: Kp = 0.6 Ku, Ti = Pu / 2, Td = Pu / 8
+            'kp': 0.6 * ku,
+            'ki': 1.2 * ku / pu,
+            'kd': 0.075 * ku * pu,
+        }
+        self.finished = True
+        log.info("autotune: Ku %.3f Pu %.0fs amplitude %.1f -> kp %.3f ki %.4f kd %.2f" % (
+            ku, pu, amplitude, self.result['kp'], self.result['ki'], self.result['kd']))
+
+    def fail(self, message):
+        log.error("autotune failed: %s" % message)
+        self.error = message
+        self.finished = True
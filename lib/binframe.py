@@ -0,0 +1,53 @@
+import sys
+import json
+import struct
+from array import array
+
+# Binary frame of float32 columns, all numbers little-endian:
+#
+#   0  4 bytes  MAGIC
+#   4  uint32   rows
+#   8  uint32   length of the metadata in bytes, a multiple of 4
+#  12  metadata JSON, space padded: {"fields": [names], ...}
+#      then one float32 column of rows values per field, in field order
+#
+# Every column starts at a multiple of 4 bytes, so a browser can wrap it
+# in a Float32Array over the received ArrayBuffer without copying.
+MAGIC = b"KCF1"
+HEADER = struct.Struct("<4sII")
+
+
+def encode(columns, fields, meta=None):
+    '''Frame of the columns {field: [values]} named in fields, meta (a dict) goes into the metadata.'''
+    meta = dict(meta or {})
+    meta['fields'] = list(fields)
+    text = json.dumps(meta).encode("utf-8")
+    text += b" " * (-len(text) % 4)
+    rows = len(columns[fields[0]]) if fields else 0
+    body = array('f')
+    for field in fields:
+        values = columns[field]
+        if len(values) != rows:
+            raise ValueError("column %s has %d values, expected %d" % (field, len(values), rows))
+        body.extend(values)
+    if sys.byteorder == "big":
+        body.byteswap()
+    return HEADER.pack(MAGIC, rows, len(text)) + text + body.tobytes()
+
+
+def decode(data):
+    '''(meta, {field: array of float32}) of a frame made by encode().'''
+    magic, rows, length = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("not a column frame")
+    meta = json.loads(data[HEADER.size:HEADER.size + length].decode("utf-8"))
+    offset = HEADER.size + length
+    columns = {}
+    for field in meta['fields']:
+        column = array('f')
+        column.frombytes(data[offset:offset + 4 * rows])
+        if sys.byteorder == "big":
+            column.byteswap()
+        columns[field] = column
+        offset += 4 * rows
+    return meta, columns
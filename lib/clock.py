@@ -0,0 +1,54 @@
+import time
+
+
+class MonotonicClock(object):
+    '''Real time, taken from time.monotonic() so NTP steps can't move it.'''
+
+    def time(self):
+        '''Seconds since an arbitrary start point.'''
+        return time.monotonic()
+
+    def millis(self):
+        return int(round(self.time() * 1000))
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+    def wait(self, waitable, timeout=None):
+        '''Waits on a threading.Event or a held threading.Condition.'''
+        return waitable.wait(timeout)
+
+
+class VirtualClock(object):
+    '''Manually advanced clock for simulations and tests.
+
+    Time only moves on advance()/advance_to() or when somebody sleeps or waits
+    on it, so a firing can be stepped through as fast as the CPU allows.
+    Nothing ever blocks: components using a VirtualClock are meant to be driven
+    through their step() methods from a single thread, not run as threads.
+    '''
+
+    def __init__(self, start=0.0):
+        self.now = start
+
+    def time(self):
+        return self.now
+
+    def millis(self):
+        return int(round(self.now * 1000))
+
+    def advance(self, seconds):
+        self.now += max(seconds, 0)
+
+    def advance_to(self, t):
+        self.now = max(self.now, t)
+
+    def sleep(self, seconds):
+        self.advance(seconds)
+
+    def wait(self, waitable, timeout=None):
+        if timeout is not None:
+            self.advance(timeout)
+        if hasattr(waitable, "is_set"):
+            return waitable.is_set()
+        return False
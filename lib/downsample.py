@@ -0,0 +1,40 @@
+def lttb(x, y, threshold):
+    '''Indices of threshold points of the series (x, y) picked by Largest-Triangle-Three-Buckets.
+
+    The first and last point are kept. The points in between are split into
+    threshold - 2 buckets and from each the point spanning the largest
+    triangle with the point picked before and the average of the next
+    bucket is kept, which preserves peaks and the shape of ramps and holds
+    far better than taking every n-th point. Returns all indices if the
+    series has no more than threshold points.
+    '''
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return list(range(n))
+    picked = [0]
+    every = (n - 2) / float(threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        # average of the next bucket, the last point for the last bucket
+        next_start = end
+        next_end = min(int((i + 2) * every) + 1, n)
+        if next_start >= next_end:
+            avg_x, avg_y = x[n - 1], y[n - 1]
+        else:
+            count = next_end - next_start
+            avg_x = sum(x[next_start:next_end]) / count
+            avg_y = sum(y[next_start:next_end]) / count
+        ax, ay = x[a], y[a]
+        best = start
+        best_area = -1.0
+        for j in range(start, end):
+            area = abs((ax - avg_x) * (y[j] - ay) - (ax - x[j]) * (avg_y - ay))
+            if area > best_area:
+                best_area = area
+                best = j
+        picked.append(best)
+        a = best
+    picked.append(n - 1)
+    return picked
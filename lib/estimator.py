@@ -0,0 +1,98 @@
+import threading
+import logging
+
+from thermal import ExactStep, model_params
+
+log = logging.getLogger(__name__)
+
+
+class KilnEstimator(object):
+    '''Kalman filter on the two-node heater/oven model of thermal.py.
+
+    The state is x = (t_oven, t_heat). Between samples it is predicted with
+    the exact model step for the heater level that was actually applied:
+    set_level() is called on every heater edge and advances the state up to
+    it, so the on-time inside a pid window is accounted for exactly. Each
+    thermocouple sample then corrects the prediction, only t_oven is
+    measured. The element temperature follows from the coupling in the
+    model.
+
+    Noise parameters are variances in degrees^2, q_* per second of
+    prediction. A larger q_oven trusts the model less, a larger r trusts
+    the thermocouple less.
+    '''
+
+    def __init__(self, params=None, q_oven=0.01, q_heat=1.0, r=1.0):
+        self.model = ExactStep(params or model_params())
+        self.q = (q_oven, q_heat)
+        self.r = r
+        self.lock = threading.Lock()
+        self.x = None
+        self.P = None
+        # time of self.x (s) and the heater level since then
+        self.time = None
+        self.level = 0.0
+        self.samples = 0
+        # last measurement minus prediction (degrees)
+        self.innovation = 0.0
+
+    def predict(self, x, P, dt):
+        phi = self.model.matrices(dt)[0]
+        x = self.model.step(x[0], x[1], self.level, dt)
+        (a, b), (c, d) = phi
+        (p00, p01), (p10, p11) = P
+        # phi P phi^T + Q dt
+        m00, m01 = a * p00 + b * p10, a * p01 + b * p11
+        m10, m11 = c * p00 + d * p10, c * p01 + d * p11
+        P = ((m00 * a + m01 * b + self.q[0] * dt, m00 * c + m01 * d),
+             (m10 * a + m11 * b, m10 * c + m11 * d + self.q[1] * dt))
+        return x, P
+
+    def advance(self, now):
+        if self.x is not None and now > self.time:
+            self.x, self.P = self.predict(self.x, self.P, now - self.time)
+            self.time = now
+
+    def set_level(self, now, level):
+        '''The heater switched to level (0..1) at now.'''
+        with self.lock:
+            self.advance(now)
+            self.level = level
+
+    def update(self, now, temperature):
+        '''Fuses a thermocouple sample taken at now, returns the estimated (t_oven, t_heat).'''
+        with self.lock:
+            self.samples += 1
+            if self.x is None:
+                # assume the element is in equilibrium with the oven
+                self.x = (temperature, temperature)
+                self.P = ((self.r, 0.0), (0.0, 100.0 * self.r))
+                self.time = now
+                return self.x
+            self.advance(now)
+            (p00, p01), (p10, p11) = self.P
+            s = p00 + self.r
+            k0, k1 = p00 / s, p10 / s
+            self.innovation = temperature - self.x[0]
+            self.x = (self.x[0] + k0 * self.innovation, self.x[1] + k1 * self.innovation)
+            # (I - K H) P
+            self.P = ((p00 - k0 * p00, p01 - k0 * p01),
+                      (p10 - k1 * p00, p11 - k1 * p01))
+            return self.x
+
+    def estimate(self, now):
+        '''Predicted (t_oven, t_heat) at now without changing the filter, None before the first sample.'''
+        with self.lock:
+            if self.x is None:
+                return None
+            if now <= self.time:
+                return self.x
+            return self.model.step(self.x[0], self.x[1], self.level, now - self.time)
+
+    def slope(self, now):
+        '''Model rate of change of t_oven at now in degrees per hour, None before the first sample.'''
+        x = self.estimate(now)
+        if x is None:
+            return None
+        a, b = self.model.A[0]
+        return (a * x[0] + b * x[1] + self.model.b_env[0]) * 3600
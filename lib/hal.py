@@ -0,0 +1,179 @@
+'''Hardware access for the drivers.
+
+The drivers talk to an RPi.GPIO compatible gpio object and spidev.SpiDev
+compatible SPI devices. config.hal picks where those come from:
+
+- "rpi":    RPi.GPIO and the kernel spidev devices
+- "memory": MemoryGPIO and MemorySPI, nothing touches real hardware
+- "auto":   "rpi" when RPi.GPIO can be imported, "memory" otherwise
+'''
+import logging
+import collections
+
+import config
+
+from clock import MonotonicClock
+
+log = logging.getLogger(__name__)
+
+try:
+    import RPi.GPIO as GPIO
+except ImportError:
+    GPIO = None
+try:
+    import spidev
+except ImportError:
+    spidev = None
+
+_gpio = None
+
+
+def backend():
+    '''Name of the configured backend, "rpi" or "memory".'''
+    if config.hal == "memory" or (config.hal == "auto" and GPIO is None):
+        return "memory"
+    return "rpi"
+
+
+def gpio():
+    '''The process wide gpio object of the configured backend.'''
+    global _gpio
+    if _gpio is None:
+        if backend() == "rpi":
+            if GPIO is None:
+                raise ImportError("hal = 'rpi' needs RPi.GPIO")
+            GPIO.setmode(GPIO.BCM)
+            GPIO.setwarnings(False)
+            _gpio = GPIO
+        else:
+            if config.hal == "auto":
+                log.warning("Could not initialize GPIOs, oven operation will only be simulated!")
+            _gpio = MemoryGPIO()
+    return _gpio
+
+
+def open_spi(bus, device):
+    '''Opens SPI device (bus, device) of the configured backend.
+
+    With the memory backend this is a MemorySPI without a device attached.
+    Raises IOError/OSError if the kernel device can't be opened.
+    '''
+    if backend() == "memory":
+        return MemorySPI()
+    if spidev is None:
+        raise IOError("spidev is not installed")
+    spi = spidev.SpiDev()
+    spi.open(bus, device)
+    return spi
+
+
+class MemoryGPIO(object):
+    '''RPi.GPIO stand-in that keeps the pin levels in memory.
+
+    Every change of a pin driven through output() is recorded as
+    (time, pin, level) in self.edges, times taken from clock. Inputs read
+    what set_input() or an attached device (see ShiftRegister) put on them.
+    '''
+    BCM = 11
+    BOARD = 10
+    OUT = 0
+    IN = 1
+    LOW = 0
+    HIGH = 1
+
+    def __init__(self, clock=None, history=100000):
+        self.clock = clock or MonotonicClock()
+        self.mode = None
+        self.directions = {}
+        self.levels = {}
+        self.edges = collections.deque(maxlen=history)
+        # Told about every output change with pin_changed(gpio, pin, level)
+        self.devices = []
+
+    def setmode(self, mode):
+        self.mode = mode
+
+    def setwarnings(self, flag):
+        pass
+
+    def setup(self, pin, direction):
+        self.directions[pin] = direction
+
+    def output(self, pin, level):
+        level = 1 if level else 0
+        if self.levels.get(pin) == level:
+            return
+        self.levels[pin] = level
+        self.edges.append((self.clock.time(), pin, level))
+        for device in self.devices:
+            device.pin_changed(self, pin, level)
+
+    def input(self, pin):
+        return self.levels.get(pin, 0)
+
+    def set_input(self, pin, level):
+        self.levels[pin] = 1 if level else 0
+
+    def attach(self, device):
+        '''Connects a simulated device to the pins, returns it.'''
+        self.devices.append(device)
+        return device
+
+    def pin_edges(self, pin):
+        '''Recorded (time, level) edges of one pin, oldest first.'''
+        return [(t, level) for t, p, level in list(self.edges) if p == pin]
+
+    def cleanup(self):
+        pass
+
+
+class MemorySPI(object):
+    '''spidev.SpiDev stand-in, transfers exchange bytes with the attached device.'''
+
+    def __init__(self, device=None):
+        self.device = device
+        self.max_speed_hz = 0
+        self.mode = 0
+        self.transfers = 0
+
+    def xfer2(self, values):
+        self.transfers += 1
+        if self.device is None:
+            return [0] * len(values)
+        return self.device.transfer(len(values))
+
+    def close(self):
+        pass
+
+
+class ShiftRegister(object):
+    '''Simulated SPI slave that shifts out self.frame, most significant bit first.
+
+    Attached to a MemoryGPIO it puts the first bit on the data pin when chip
+    select goes low and the next one on every rising clock edge, the way the
+    MAX31855 and MAX6675 drivers sample. Attached to a MemorySPI it returns
+    the frame as bytes. A thermocouple reading is simulated by setting frame.
+    '''
+
+    def __init__(self, cs_pin, clock_pin, data_pin, bits=32, frame=0):
+        self.cs_pin = cs_pin
+        self.clock_pin = clock_pin
+        self.data_pin = data_pin
+        self.bits = bits
+        self.frame = frame
+        self.bit = None
+
+    def pin_changed(self, gpio, pin, level):
+        if pin == self.cs_pin:
+            self.bit = None if level else self.bits - 1
+        elif pin == self.clock_pin and level and self.bit is not None:
+            self.bit -= 1
+        else:
+            return
+        if self.bit is not None and self.bit >= 0:
+            gpio.set_input(self.data_pin, (self.frame >> self.bit) & 1)
+
+    def transfer(self, n):
+        shift = 8 * n - self.bits
+        frame = self.frame << shift if shift >= 0 else self.frame >> -shift
+        return [(frame >> (8 * (n - 1 - i))) & 0xFF for i in range(n)]
@@ -0,0 +1,107 @@
+import threading
+import logging
+import collections
+
+import config
+import hal
+
+from clock import MonotonicClock
+
+log = logging.getLogger(__name__)
+
+
+class HeaterOutput(threading.Thread):
+    '''Time-proportioning driver for the heater SSR.
+
+    start_window() takes the heater on-time for one window and computes the
+    on and off edges against the clock once. The thread sleeps until
+    each edge is due and switches the pin, so the duty cycle costs no polling.
+    Every edge is recorded as (intended, actual, level) in self.history,
+    jitter() summarizes how late the edges were.
+
+    Times are taken from clock (a MonotonicClock by default), the pin is
+    driven through gpio (hal.gpio() by default). With threaded=False the
+    thread isn't started and step() has to be called.
+    '''
+
+    def __init__(self, pin=config.gpio_heat, invert=config.heater_invert, history=500, clock=None, threaded=True,
+                 gpio=None):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.pin = pin
+        self.invert = invert
+        self.clock = clock or MonotonicClock()
+        self.level = 0
+        # Pending (time, level) edges in chronological order
+        self.edges = []
+        self.history = collections.deque(maxlen=history)
+        # Called with the new level whenever the output switches
+        self.listeners = []
+        self.cond = threading.Condition()
+        self.gpio = gpio or hal.gpio()
+        self.gpio.setup(self.pin, self.gpio.OUT)
+        self.write(0)
+        if threaded:
+            self.start()
+
+    def start_window(self, on_time, window, start=None):
+        '''Heats for on_time seconds out of the next window seconds.'''
+        if start is None:
+            start = self.clock.time()
+        on_time = min(max(on_time, 0), window)
+        edges = []
+        if on_time > 0:
+            edges.append((start, 1))
+        if on_time < window:
+            edges.append((start + on_time, 0))
+        with self.cond:
+            self.edges = edges
+            self.cond.notify()
+
+    def off(self):
+        '''Cancels the current window and switches the heater off right away.'''
+        self.hold(0)
+
+    def hold(self, level):
+        '''Cancels the current window and keeps the heater at level until told otherwise.'''
+        with self.cond:
+            self.edges = []
+            self.write(level)
+            self.cond.notify()
+
+    def step(self):
+        '''Executes all due edges, returns the time of the next one or None.'''
+        with self.cond:
+            now = self.clock.time()
+            while self.edges and self.edges[0][0] <= now:
+                intended, level = self.edges.pop(0)
+                self.write(level)
+                self.history.append((intended, self.clock.time(), level))
+            return self.edges[0][0] if self.edges else None
+
+    def run(self):
+        with self.cond:
+            while True:
+                next_edge = self.step()
+                if next_edge is None:
+                    self.clock.wait(self.cond)
+                else:
+                    self.clock.wait(self.cond, max(0, next_edge - self.clock.time()))
+
+    def write(self, level):
+        if level != self.invert:
+            self.gpio.output(self.pin, self.gpio.HIGH)
+        else:
+            self.gpio.output(self.pin, self.gpio.LOW)
+        if level != self.level:
+            log.debug("heater %s" % ("ON" if level else "OFF"))
+            self.level = level
+            for listener in self.listeners:
+                listener(level)
+
+    def jitter(self):
+        '''Lateness of the recorded edges in seconds (count, mean, max).'''
+        late = [actual - intended for intended, actual, level in self.history]
+        if not late:
+            return {'count': 0, 'mean': 0.0, 'max': 0.0}
+        return {'count': len(late), 'mean': sum(late) / len(late), 'max': max(late)}
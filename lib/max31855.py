@@ -1,15 +1,38 @@
 #!/usr/bin/python
-import RPi.GPIO as GPIO
+import hal
+import typek
+
+# Hardware SPI buses of the Raspberry Pi in BCM numbering:
+# bus -> (clock pin, MISO pin, chip enable pins by device number)
+SPI_BUSES = {
+    0: (11, 9, [8, 7]),
+    1: (21, 19, [18, 17, 16]),
+}
+# SCK limit of the MAX31855
+SPI_MAX_SPEED_HZ = 5000000
+
+
+def spi_device(cs_pin, clock_pin, data_pin):
+    '''(bus, device) of the hardware SPI port the BCM pins are wired to, None if they aren't.'''
+    for bus, (clock, miso, chip_enables) in SPI_BUSES.items():
+        if clock_pin == clock and data_pin == miso and cs_pin in chip_enables:
+            return bus, chip_enables.index(cs_pin)
+    return None
+
 
 class MAX31855(object):
     '''Python driver for [MAX38155 Cold-Junction Compensated Thermocouple-to-Digital Converter](http://www.maximintegrated.com/datasheet/index.mvp/id/7273)
      Requires:
      - The [GPIO Library](https://code.google.com/p/raspberry-gpio-python/) (Already on most Raspberry Pi OS builds)
      - A [Raspberry Pi](http://www.raspberrypi.org/)
+     - Optionally [spidev](https://pypi.org/project/spidev/): when the pins are a
+       hardware SPI port (with SPI enabled in the kernel) a sample is a single
+       4 byte transfer instead of 32 bit-banged clock cycles.
 
     '''
-    def __init__(self, cs_pin, clock_pin, data_pin, units = "c", board = GPIO.BCM):
-        '''Initialize Soft (Bitbang) SPI bus
+    def __init__(self, cs_pin, clock_pin, data_pin, units = "c", board = None, gpio = None, spi = None,
+                 linearize = False):
+        '''Initialize SPI bus, the kernel one if the pins allow it, bitbang otherwise
 
         Parameters:
         - cs_pin:    Chip Select (CS) / Slave Select (SS) pin (Any GPIO)  
@@ -17,6 +40,10 @@ class MAX31855(object):
         - data_pin:  Data input (SO / MOSI) pin (Any GPIO)
         - units:     (optional) unit of measurement to return. ("c" (default) | "k" | "f")
         - board:     (optional) pin numbering method as per RPi.GPIO library (GPIO.BCM (default) | GPIO.BOARD)
+        - gpio:      (optional) RPi.GPIO compatible object to bitbang with (hal.gpio() (default))
+        - spi:       (optional) opened spidev.SpiDev compatible object, forces the kernel SPI path,
+                     False forces bitbanging
+        - linearize: (optional) correct the chip's linear type K approximation with the NIST tables (see typek)
 
         '''
         self.cs_pin = cs_pin
@@ -24,22 +51,38 @@ class MAX31855(object):
         self.data_pin = data_pin
         self.units = units
         self.data = None
-        self.board = board
+        self.linearize = linearize
+        self.gpio = gpio or hal.gpio()
+        self.board = board if board is not None else self.gpio.BCM
+        self.spi = None if spi is False else spi
+
+        if spi is None and self.board == self.gpio.BCM:
+            device = spi_device(cs_pin, clock_pin, data_pin)
+            if device is not None:
+                try:
+                    self.spi = hal.open_spi(*device)
+                except (IOError, OSError):
+                    # SPI not enabled in the kernel, bitbang the same pins
+                    self.spi = None
+        if self.spi is not None:
+            self.spi.max_speed_hz = SPI_MAX_SPEED_HZ
+            self.spi.mode = 0
+            return
 
         # Initialize needed GPIO
-        GPIO.setmode(self.board)
-        GPIO.setup(self.cs_pin, GPIO.OUT)
-        GPIO.setup(self.clock_pin, GPIO.OUT)
-        GPIO.setup(self.data_pin, GPIO.IN)
+        self.gpio.setmode(self.board)
+        self.gpio.setup(self.cs_pin, self.gpio.OUT)
+        self.gpio.setup(self.clock_pin, self.gpio.OUT)
+        self.gpio.setup(self.data_pin, self.gpio.IN)
 
         # Pull chip select high to make chip inactive
-        GPIO.output(self.cs_pin, GPIO.HIGH)
+        self.gpio.output(self.cs_pin, self.gpio.HIGH)
 
     def get(self):
         '''Reads SPI bus and returns current value of thermocouple.'''
         self.read()
         self.checkErrors()
-        return getattr(self, "to_" + self.units)(self.data_to_tc_temperature())
+        return getattr(self, "to_" + self.units)(self.data_to_temperature())
 
     def get_rj(self):
         '''Reads SPI bus and returns current value of reference junction.'''
@@ -48,18 +91,29 @@ class MAX31855(object):
 
     def read(self):
         '''Reads 32 bits of the SPI bus & stores as an integer in self.data.'''
+        if self.spi is not None:
+            # one full-duplex transfer, the kernel drives chip select
+            b = self.spi.xfer2([0, 0, 0, 0])
+            self.data = (b[0] << 24) | (b[1] << 16) | (b[2] << 8) | b[3]
+            return
+        output = self.gpio.output
+        read_pin = self.gpio.input
+        low = self.gpio.LOW
+        high = self.gpio.HIGH
+        clock_pin = self.clock_pin
+        data_pin = self.data_pin
         bytesin = 0
         # Select the chip
-        GPIO.output(self.cs_pin, GPIO.LOW)
+        output(self.cs_pin, low)
         # Read in 32 bits
         for i in range(32):
-            GPIO.output(self.clock_pin, GPIO.LOW)
+            output(clock_pin, low)
             bytesin = bytesin << 1
-            if (GPIO.input(self.data_pin)):
+            if (read_pin(data_pin)):
                 bytesin = bytesin | 1
-            GPIO.output(self.clock_pin, GPIO.HIGH)
+            output(clock_pin, high)
         # Unselect the chip
-        GPIO.output(self.cs_pin, GPIO.HIGH)
+        output(self.cs_pin, high)
         # Save data
         self.data = bytesin
 
@@ -73,11 +127,9 @@ class MAX31855(object):
         shortToVCC = (data_32 & 0x00000004) != 0         # SCV bit, D2
         if anyErrors:
             if noConnection:
-                # raise MAX31855Error("No Connection")
-                print("MAX31855Error(No Connection)")
+                raise MAX31855Error("No Connection")
             elif shortToGround:
-                #raise MAX31855Error("Thermocouple short to ground")
-                print("Thermocouple reports short to ground")
+                raise MAX31855Error("Thermocouple short to ground")
             elif shortToVCC:
                 raise MAX31855Error("Thermocouple short to VCC")
             else:
@@ -85,6 +137,13 @@ class MAX31855(object):
                 # Did you remember to initialize all other SPI devices?
                 raise MAX31855Error("Unknown Error")
 
+    def data_to_temperature(self, data_32 = None):
+        '''Takes an integer and returns the thermocouple temperature in celsius, linearized if enabled.'''
+        tc = self.data_to_tc_temperature(data_32)
+        if self.linearize:
+            tc = typek.linearize(tc, self.data_to_rj_temperature(data_32))
+        return tc
+
     def data_to_tc_temperature(self, data_32 = None):
         '''Takes an integer and returns a thermocouple temperature in celsius.'''
         if data_32 is None:
@@ -134,8 +193,61 @@ class MAX31855(object):
 
     def cleanup(self):
         '''Selective GPIO cleanup'''
-        GPIO.setup(self.cs_pin, GPIO.IN)
-        GPIO.setup(self.clock_pin, GPIO.IN)
+        if self.spi is not None:
+            self.spi.close()
+            return
+        self.gpio.setup(self.cs_pin, self.gpio.IN)
+        self.gpio.setup(self.clock_pin, self.gpio.IN)
+
+class MAX31855Bus(object):
+    '''Several MAX31855 sharing the clock and data lines, each with its own chip select.
+
+    read() takes one frame per chip in a single pass and decodes both the
+    thermocouple and the reference junction temperature from it, so N
+    channels cost N transfers.
+
+    The whole bus takes one path: the kernel SPI one only if every chip
+    select is a chip enable pin with a spidev device, bitbanging otherwise.
+    A bitbanged chip sets the shared clock and data pins up as GPIO, which
+    takes them away from the kernel driver of the other chips.
+
+    '''
+    def __init__(self, channels, clock_pin, data_pin, units = "c", board = None, gpio = None, linearize = False):
+        '''
+        Parameters:
+        - channels:  list of (name, cs_pin)
+        - clock_pin, data_pin, units, board, gpio, linearize: as for MAX31855
+        '''
+        hardware = all(spi_device(cs_pin, clock_pin, data_pin) is not None for name, cs_pin in channels)
+        self.chips = [(name, MAX31855(cs_pin, clock_pin, data_pin, units, board, gpio, None if hardware else False,
+                                      linearize))
+                      for name, cs_pin in channels]
+        if hardware and any(chip.spi is None for name, chip in self.chips):
+            # some chip enable has no spidev device (e.g. the spi0-1cs overlay)
+            for name, chip in self.chips:
+                chip.cleanup()
+            self.chips = [(name, MAX31855(cs_pin, clock_pin, data_pin, units, board, gpio, False, linearize))
+                          for name, cs_pin in channels]
+
+    def read(self):
+        '''Returns {name: {'temperature', 'reference', 'error'}}, temperature None on a fault.'''
+        readings = {}
+        for name, chip in self.chips:
+            chip.read()
+            convert = getattr(chip, "to_" + chip.units)
+            reading = {'reference': convert(chip.data_to_rj_temperature()), 'error': None}
+            try:
+                chip.checkErrors()
+                reading['temperature'] = convert(chip.data_to_temperature())
+            except MAX31855Error as e:
+                reading['temperature'] = None
+                reading['error'] = e.value
+            readings[name] = reading
+        return readings
+
+    def cleanup(self):
+        for name, chip in self.chips:
+            chip.cleanup()
 
 class MAX31855Error(Exception):
      def __init__(self, value):
@@ -147,26 +259,21 @@ if __name__ == "__main__":
 
     # Multi-chip example
     import time
-    cs_pins = [4, 17, 18, 24]
+    channels = [("a", 4), ("b", 17), ("c", 18), ("d", 24)]
     clock_pin = 23
     data_pin = 22
     units = "f"
-    thermocouples = []
-    for cs_pin in cs_pins:
-        thermocouples.append(MAX31855(cs_pin, clock_pin, data_pin, units))
+    bus = MAX31855Bus(channels, clock_pin, data_pin, units)
     running = True
     while(running):
         try:
-            for thermocouple in thermocouples:
-                rj = thermocouple.get_rj()
-                try:
-                    tc = thermocouple.get()
-                except MAX31855Error as e:
-                    tc = "Error: "+ e.value
+            for name, reading in sorted(bus.read().items()):
+                tc = reading['temperature']
+                if reading['error']:
+                    tc = "Error: " + reading['error']
                     running = False
-                print("tc: {} and rj: {}".format(tc, rj))
+                print("{}: tc: {} and rj: {}".format(name, tc, reading['reference']))
             time.sleep(1)
         except KeyboardInterrupt:
             running = False
-    for thermocouple in thermocouples:
-        thermocouple.cleanup()
+    bus.cleanup()
@@ -1,15 +1,31 @@
 #!/usr/bin/python
-import RPi.GPIO as GPIO
 import time
 
+import hal
+
+from clock import MonotonicClock
+
+# Worst case conversion time of the MAX6675 (s). Pulling CS low aborts a
+# running conversion and shifts out the previous result, CS high starts
+# the next one.
+CONVERSION_TIME = 0.22
+
+
 class MAX6675(object):
     '''Python driver for [MAX6675 Cold-Junction Compensated Thermocouple-to-Digital Converter](http://www.adafruit.com/datasheets/MAX6675.pdf)
      Requires:
      - The [GPIO Library](https://code.google.com/p/raspberry-gpio-python/) (Already on most Raspberry Pi OS builds)
      - A [Raspberry Pi](http://www.raspberrypi.org/)
 
+     The bus is clocked as fast as GPIO calls go (the chip takes up to
+     4.3 MHz), nothing sleeps. A read that comes less than CONVERSION_TIME
+     after the previous one would only abort the running conversion and get
+     the old result again, so it returns the cached frame without touching
+     the bus; age() tells how old the returned value is. The first read
+     waits for the conversion started in __init__ to finish.
+
     '''
-    def __init__(self, cs_pin, clock_pin, data_pin, units = "c", board = GPIO.BCM):
+    def __init__(self, cs_pin, clock_pin, data_pin, units = "c", board = None, gpio = None, clock = None):
         '''Initialize Soft (Bitbang) SPI bus
 
         Parameters:
@@ -18,6 +34,8 @@ class MAX6675(object):
         - data_pin:  Data input (SO / MOSI) pin (Any GPIO)
         - units:     (optional) unit of measurement to return. ("c" (default) | "k" | "f")
         - board:     (optional) pin numbering method as per RPi.GPIO library (GPIO.BCM (default) | GPIO.BOARD)
+        - gpio:      (optional) RPi.GPIO compatible object to bitbang with (hal.gpio() (default))
+        - clock:     (optional) time source for the conversion window (MonotonicClock (default))
 
         '''
         self.cs_pin = cs_pin
@@ -25,16 +43,21 @@ class MAX6675(object):
         self.data_pin = data_pin
         self.units = units
         self.data = None
-        self.board = board
+        self.gpio = gpio or hal.gpio()
+        self.board = board if board is not None else self.gpio.BCM
+        self.clock = clock or MonotonicClock()
+        # time the last frame was shifted out, a new conversion started then
+        self.read_time = None
 
         # Initialize needed GPIO
-        GPIO.setmode(self.board)
-        GPIO.setup(self.cs_pin, GPIO.OUT)
-        GPIO.setup(self.clock_pin, GPIO.OUT)
-        GPIO.setup(self.data_pin, GPIO.IN)
+        self.gpio.setmode(self.board)
+        self.gpio.setup(self.cs_pin, self.gpio.OUT)
+        self.gpio.setup(self.clock_pin, self.gpio.OUT)
+        self.gpio.setup(self.data_pin, self.gpio.IN)
 
-        # Pull chip select high to make chip inactive
-        GPIO.output(self.cs_pin, GPIO.HIGH)
+        # Pull chip select high to make chip inactive, this starts a conversion
+        self.gpio.output(self.cs_pin, self.gpio.HIGH)
+        self.start_time = self.clock.time()
 
     def get(self):
         '''Reads SPI bus and returns current value of thermocouple.'''
@@ -43,23 +66,52 @@ class MAX6675(object):
         return getattr(self, "to_" + self.units)(self.data_to_tc_temperature())
 
     def read(self):
-        '''Reads 16 bits of the SPI bus & stores as an integer in self.data.'''
+        '''Reads 16 bits of the SPI bus & stores as an integer in self.data.
+
+        Returns False (and keeps self.data) instead when the conversion
+        started by the previous read can't have finished yet.
+        '''
+        now = self.clock.time()
+        if now - self.start_time < CONVERSION_TIME:
+            if self.data is not None:
+                return False
+            # nothing cached yet, clocking the bus now would get the power-on frame
+            self.clock.sleep(CONVERSION_TIME - (now - self.start_time))
+            now = self.clock.time()
+        output = self.gpio.output
+        read_pin = self.gpio.input
+        low = self.gpio.LOW
+        high = self.gpio.HIGH
+        clock_pin = self.clock_pin
+        data_pin = self.data_pin
         bytesin = 0
         # Select the chip
-        GPIO.output(self.cs_pin, GPIO.LOW)
+        output(self.cs_pin, low)
         # Read in 16 bits
         for i in range(16):
-            GPIO.output(self.clock_pin, GPIO.LOW)
-            time.sleep(0.001)
+            output(clock_pin, low)
             bytesin = bytesin << 1
-            if (GPIO.input(self.data_pin)):
+            if (read_pin(data_pin)):
                 bytesin = bytesin | 1
-            GPIO.output(self.clock_pin, GPIO.HIGH)
-        time.sleep(0.001)
-        # Unselect the chip
-        GPIO.output(self.cs_pin, GPIO.HIGH)
+            output(clock_pin, high)
+        # Unselect the chip, the next conversion starts
+        output(self.cs_pin, high)
+        self.start_time = self.clock.time()
         # Save data
         self.data = bytesin
+        self.read_time = now
+        return True
+
+    def age(self):
+        '''Seconds since the current value was read from the chip, None before the first read.'''
+        if self.read_time is None:
+            return None
+        return self.clock.time() - self.read_time
+
+    def get_with_age(self):
+        '''Like get(), returns (temperature, age of the reading in seconds).'''
+        temperature = self.get()
+        return temperature, self.age()
 
     def checkErrors(self, data_16 = None):
         '''Checks errors on bit D2'''
@@ -93,8 +145,8 @@ class MAX6675(object):
 
     def cleanup(self):
         '''Selective GPIO cleanup'''
-        GPIO.setup(self.cs_pin, GPIO.IN)
-        GPIO.setup(self.clock_pin, GPIO.IN)
+        self.gpio.setup(self.cs_pin, self.gpio.IN)
+        self.gpio.setup(self.clock_pin, self.gpio.IN)
 
 class MAX6675Error(Exception):
      def __init__(self, value):
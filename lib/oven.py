@@ -7,6 +7,9 @@ import json
 
 import config
 
+from clock import MonotonicClock
+from heater import HeaterOutput
+
 log = logging.getLogger(__name__)
 
 try:
@@ -32,19 +35,6 @@ except ImportError:
     log.exception("Could not initialize temperature sensor, using dummy values!")
     sensor_available = False
 
-try:
-    import RPi.GPIO as GPIO
-    GPIO.setmode(GPIO.BCM)
-    GPIO.setwarnings(False)
-    GPIO.setup(config.gpio_heat, GPIO.OUT)
-
-
-    gpio_available = True
-except ImportError:
-    msg = "Could not initialize GPIOs, oven operation will only be simulated!"
-    log.warning(msg)
-    gpio_available = False
-
 
 class Oven (threading.Thread):
     STATE_IDLE = "IDLE"
@@ -60,6 +50,7 @@ class Oven (threading.Thread):
         self.daemon = True
         self.simulate = simulate
         self.time_step = time_step
+        self.output = HeaterOutput()
         self.reset()
         if simulate:
             self.temp_sensor = TempSensorSimulate(self, 0.5, self.time_step)
@@ -130,7 +121,6 @@ class Oven (threading.Thread):
                 else:
                     temperature_count = 0
                     
-                # Capture the last temperature value. This must be done before set_heat, since there is a sleep
                 last_temp = self.temp_sensor.temperature
                 self.set_heat(pid)
 
@@ -138,32 +128,16 @@ class Oven (threading.Thread):
                 if self.profile.finished():
                     self.reset()
 
-            if pid > 0:
-                time.sleep(self.time_step * (1 - pid))
-                log.info("pid is %.1f. Sleep for %.2f" % (pid, self.time_step * (1 - pid)))
-            else:
-                log.info("pid is %.1f. Sleep for %.2f" % (pid, self.time_step))
-                time.sleep(self.time_step)
+            time.sleep(self.time_step)
 
     def set_heat(self, value):
+        # Heat for value * time_step of the next time_step, HeaterOutput times the edges
         if value > 0:
             self.heat = 1.0
-            if gpio_available:
-               if config.heater_invert:
-                 GPIO.output(config.gpio_heat, GPIO.LOW)
-                 time.sleep(self.time_step * value)
-                 GPIO.output(config.gpio_heat, GPIO.HIGH)   
-               else:
-                 GPIO.output(config.gpio_heat, GPIO.HIGH)
-                 time.sleep(self.time_step * value)
-                 GPIO.output(config.gpio_heat, GPIO.LOW)
+            self.output.start_window(self.time_step * value, self.time_step)
         else:
             self.heat = 0.0
-            if gpio_available:
-               if config.heater_invert:
-                 GPIO.output(config.gpio_heat, GPIO.HIGH)
-               else:
-                 GPIO.output(config.gpio_heat, GPIO.LOW)
+            self.output.off()
 
    
     
@@ -361,17 +335,18 @@ class Profile:
 
 
 class PID():
-    def __init__(self, ki=1, kp=1, kd=1):
+    def __init__(self, ki=1, kp=1, kd=1, clock=None):
         self.ki = ki
         self.kp = kp
         self.kd = kd
-        self.lastNow = datetime.datetime.now()
+        self.clock = clock or MonotonicClock()
+        self.lastNow = self.clock.time()
         self.iterm = 0
         self.lastErr = 0
 
     def compute(self, setpoint, ispoint):
-        now = datetime.datetime.now()
-        timeDelta = (now - self.lastNow).total_seconds()
+        now = self.clock.time()
+        timeDelta = now - self.lastNow
 
         error = float(setpoint - ispoint)
         self.iterm += (error * timeDelta * self.ki)
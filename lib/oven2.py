@@ -1,17 +1,30 @@
 import threading
-import time
 import random
-import datetime
 import logging
 import json
+import bisect
 
 import config
-
-from utils import millis
+import hal
+
+from clock import MonotonicClock
+from heater import HeaterOutput
+from autotune import RelayAutotune
+from ringbuffer import SampleRing, REDUCERS
+from sensorguard import SensorGuard, SensorFault
+from estimator import KilnEstimator
+from thermal import ExactStep, model_params
 from simple_pid import PID
 
 log = logging.getLogger(__name__)
 
+try:
+    import numpy as np
+
+    numpy_available = True
+except ImportError:
+    numpy_available = False
+
 # max number of segments
 max_number_segs = 20
 # Hold time for each segment (min).  This starts after it reaches target temp.
@@ -26,13 +39,17 @@ seg_num = 0
 seg_phase = 0
 # This is how close the temp reading needs to be to the set point to shift to the hold phase (degrees).  Set to zero or a positive integer.
 temp_range = 5
+# Temperature a ramp-hold schedule starts ramping from (degrees).
+ramp_hold_start_temp = 75
+# Window (s) the rate of rise reported in get_state is fitted over.
+slope_window = 120
 pid_cycle = 7500
 try:
     if config.max31855 + config.max6675 + config.max31855spi > 1:
         log.error("choose (only) one converter IC")
         exit()
     if config.max31855:
-        from max31855 import MAX31855, MAX31855Error
+        from max31855 import MAX31855, MAX31855Bus, MAX31855Error
 
         log.info("import MAX31855")
     if config.max31855spi:
@@ -45,33 +62,55 @@ try:
         if config.gpio_heat in spi_reserved_gpio:
             raise Exception("gpio_heat pin %s collides with SPI pins %s" % (config.gpio_heat, spi_reserved_gpio))
     if config.max6675:
-        from max6675 import MAX6675, MAX6675Error
+        from max6675 import MAX6675, MAX6675Error, CONVERSION_TIME
 
         log.info("import MAX6675")
     sensor_available = True
 except ImportError:
     log.exception("Could not initialize temperature sensor, using dummy values!")
     sensor_available = False
+if sensor_available and hal.backend() == "memory":
+    log.warning("in-memory GPIO backend, the temperature sensor is simulated")
+    sensor_available = False
 
-try:
-    import RPi.GPIO as GPIO
 
-    GPIO.setmode(GPIO.BCM)
-    GPIO.setwarnings(False)
-    GPIO.setup(config.gpio_heat, GPIO.OUT)
+def poll_interval(slope, to_transition, fastest=config.sensor_time_min, normal=config.sensor_time_wait,
+                  slowest=config.sensor_time_max, resolution=config.sensor_resolution, still=config.sensor_still_slope):
+    """Seconds the sensor should wait before its next read.
 
-    gpio_available = True
-except ImportError:
-    msg = "Could not initialize GPIOs, oven operation will only be simulated!"
-    log.warning(msg)
-    gpio_available = False
+    normal while the temperature moves, shorter when one sample per
+    resolution degrees of change at the current slope (degrees per hour)
+    needs it, and fastest while a schedule transition is due within
+    slowest seconds. Only while the temperature is about still (slope below
+    still degrees per hour, holds and idle) the wait grows to slowest.
+    """
+    if slope is None:
+        interval = normal
+    elif abs(slope) < still:
+        interval = slowest
+    else:
+        interval = min(normal, resolution / abs(slope) * 3600)
+    if to_transition is not None and to_transition <= slowest:
+        interval = fastest
+    return max(fastest, interval)
 
 
 class Oven(threading.Thread):
     STATE_IDLE = "IDLE"
     STATE_RUNNING = "RUNNING"
-
-    def __init__(self, simulate=False, time_step=config.sensor_time_wait):
+    STATE_TUNING = "TUNING"
+
+    def __init__(self, simulate=False, time_step=config.sensor_time_wait, clock=None, threaded=True, gains=None,
+                 gpio=None):
+        """With threaded=False no threads are started and the owner drives the
+        oven, its sensor and its output through their step() methods, which is
+        how a VirtualClock runs a firing faster than real time.
+
+        gains is a (kp, ki, kd) tuple, by default the pid_* values from config.py.
+        gpio is the RPi.GPIO compatible object the heater and the sensor are
+        wired to, by default the configured hal backend (in memory for a
+        simulated oven).
+        """
         threading.Thread.__init__(self)
         self.profile = None
         self.start_time = 0
@@ -81,88 +120,250 @@ class Oven(threading.Thread):
         self.daemon = True
         self.simulate = simulate
         self.time_step = time_step
+        self.clock = clock or MonotonicClock()
+        self.gains = gains or (config.pid_kp, config.pid_ki, config.pid_kd)
         self.heat = 0
+        # Heater on-time (s) for the current pid cycle
+        self.duty = 0
+        # Last relay autotune run, kept after it ends for its result
+        self.autotune = None
+        # Model based filter of the sensor samples, see estimator.py
+        self.estimator = None
+        if config.estimator:
+            self.estimator = KilnEstimator(q_oven=config.estimator_q_oven, q_heat=config.estimator_q_heat,
+                                           r=config.estimator_r)
+        # Time of the last sample fed to the estimator
+        self.fused = None
+        # Guards the control state between the control loop and the websocket handlers
+        self.lock = threading.RLock()
+        # Set to wake the control loop before its next deadline
+        self.wakeup = threading.Event()
+        # Counts the changes observers of get_state() should hear about right away, see wait_change()
+        self.changes = threading.Condition()
+        self.version = 0
+        # A simulated oven must never switch the real relay
+        if simulate and gpio is None:
+            gpio = hal.MemoryGPIO(self.clock)
+        self.output = HeaterOutput(clock=self.clock, threaded=threaded, gpio=gpio)
+        self.output.listeners.append(self.set_heat)
         self.reset()
-        if simulate:
-            self.temp_sensor = TempSensorSimulate(self, 0.5, self.time_step)
-        if sensor_available:
-            self.temp_sensor = TempSensorReal(self.time_step)
+        if simulate or not sensor_available:
+            self.temp_sensor = TempSensorSimulate(self, 0.5, self.time_step, self.clock)
         else:
-            self.temp_sensor = TempSensorSimulate(self,
-                                                  self.time_step,
-                                                  self.time_step)
-        self.temp_sensor.start()
-        self.start()
+            self.temp_sensor = TempSensorReal(self.time_step, self.clock, gpio)
+        if self.estimator:
+            self.temp_sensor.listeners.append(self.fuse)
+        self.temp_sensor.listeners.append(self.notify)
+        self.temp_sensor.scheduler = self.sample_interval
+        if threaded:
+            self.temp_sensor.start()
+            self.start()
 
     def reset(self):
-        self.profile = None
-        self.start_time = 0
-        self.runtime = 0
-        self.target = 0
-        self.state = Oven.STATE_IDLE
-        if gpio_available:
-            GPIO.output(config.gpio_heat, GPIO.LOW)
-        self.pid = PID(Kp=config.pid_kp, Ki=config.pid_ki, Kd=config.pid_kd, sample_time=pid_cycle / 1000,
-                       output_limits=(0, pid_cycle / 1000), auto_mode=True)
+        with self.lock:
+            self.profile = None
+            self.start_time = 0
+            self.runtime = 0
+            self.target = 0
+            self.duty = 0
+            self.state = Oven.STATE_IDLE
+            # Time (s) the sensor became faulted during the run
+            self.fault_since = None
+            self.output.off()
+            # The loop already runs the pid once per pid_cycle, so no sample_time
+            kp, ki, kd = self.gains
+            self.pid = PID(Kp=kp, Ki=ki, Kd=kd, sample_time=None,
+                           output_limits=(0, pid_cycle / 1000), auto_mode=True, time_fn=self.clock.time)
+        self.changed()
 
     def run_profile(self, profile):
         log.info("Running profile %s" % profile.name)
-        self.profile = profile
-        self.profile.running = True
-        # Ramp-hold init
-        self.profile.rampStart = millis()
-        self.profile.pidStart = millis()
-        self.profile.segNum = 1
-
-        self.state = Oven.STATE_RUNNING
-        self.start_time = datetime.datetime.now()
+        with self.lock:
+            now = self.clock.millis()
+            self.profile = profile
+            self.profile.running = True
+            # Ramp-hold init
+            self.profile.rampStart = now
+            self.profile.pidStart = now
+            self.profile.segNum = 1
+
+            self.state = Oven.STATE_RUNNING
+            self.start_time = self.clock.time()
         log.info("Starting")
+        self.changed()
+        self.notify()
+
+    def run_autotune(self, setpoint, hysteresis=2.0, cycles=3):
+        """Starts a relay autotune run around setpoint instead of a profile.
+
+        The heater is bang-bang controlled around the setpoint until the
+        oscillation has been measured, then the oven goes idle and the proposed
+        gains are in get_state()['autotune'].
+        """
+        log.info("Autotune around %.1f" % setpoint)
+        with self.lock:
+            self.reset()
+            self.autotune = RelayAutotune(setpoint, pid_cycle / 1000, hysteresis, cycles)
+            self.state = Oven.STATE_TUNING
+            self.start_time = self.clock.time()
+        self.changed()
+        self.notify()
 
     def abort_run(self):
         self.reset()
+        self.notify()
+
+    def notify(self):
+        """Wakes the control loop, e.g. on a new sensor sample or a command."""
+        self.wakeup.set()
+
+    def changed(self):
+        """Tells the waiters in wait_change() the state changed: a command, a heater
+        edge, a new segment, a sensor fault or its recovery."""
+        with self.changes:
+            self.version += 1
+            self.changes.notify_all()
+
+    def wait_change(self, version, timeout=None):
+        """Waits until there was a change after version or timeout seconds passed,
+        returns the current version."""
+        with self.changes:
+            self.changes.wait_for(lambda: self.version != version, timeout)
+            return self.version
 
     def run(self):
-        temperature_count = 0
-        last_temp = 0
-        pid = 0
-
         while True:
-
-            if self.state == Oven.STATE_RUNNING:
-                if self.simulate:
-                    self.runtime += 0.5
+            self.wakeup.clear()
+            deadline = self.step()
+            if deadline is None:
+                # Idle: nothing to do until a command arrives
+                self.clock.wait(self.wakeup)
+            else:
+                self.clock.wait(self.wakeup, max(0, deadline - self.clock.millis()) / 1000.0)
+
+    def step(self):
+        """Runs one pass of the control loop.
+
+        Returns the time (ms) of the next deadline the loop has to wake up for,
+        or None if the oven is idle.
+        """
+        with self.lock:
+            if self.state not in (Oven.STATE_RUNNING, Oven.STATE_TUNING):
+                return None
+            if self.temp_sensor.fault:
+                return self.step_fault()
+            if self.fault_since is not None:
+                log.info("sensor recovered, resuming control")
+                self.fault_since = None
+                self.changed()
+            if self.state == Oven.STATE_TUNING:
+                return self.step_autotune()
+
+            now = self.clock.millis()
+            self.runtime = self.clock.time() - self.start_time
+            temperature = self.temperature()
+
+            if now - self.profile.pidStart >= pid_cycle:
+                self.profile.pidStart = now
+                if self.profile.type == "profile":
+                    segment = self.profile.currentState
+                    self.target = self.profile.get_target_temperature(self.runtime, temperature)
+                    if segment != self.profile.currentState:
+                        self.changed()
                 else:
-                    runtime_delta = datetime.datetime.now() - self.start_time
-                    self.runtime = runtime_delta.total_seconds()
-
-                if millis() - self.profile.pidStart >= pid_cycle:
-                    self.profile.pidStart = millis()
-                    self.target = self.profile.update_pid(self.temp_sensor.temperature)
-                    self.pid.setpoint = self.target
-                    pid = self.pid(self.temp_sensor.temperature)
-                    log.info("update pid at %.1f deg F (Target: %.1f) , PID %.1f, phase % .1s" % (
-                        self.temp_sensor.temperature, self.target,  pid,
-                        "Hold" if self.profile.segPhase == 1 else "Ramp"))
-
-                # Capture the last temperature value. This must be done before set_heat, since there is a sleep
-                last_temp = self.temp_sensor.temperature
-                self.set_heat2(pid, self.profile.pidStart)
+                    self.target = self.profile.update_pid(temperature, now)
+                self.pid.setpoint = self.target
+                self.duty = self.pid(temperature)
+                self.output.start_window(self.duty, pid_cycle / 1000)
+                # Simulations run thousands of cycles per second, keep them out of the log
+                log.log(logging.DEBUG if self.simulate else logging.INFO,
+                        "update pid at %.1f deg F (Target: %.1f) , PID %.1f, phase % .1s" % (
+                            temperature, self.target, self.duty,
+                            "Hold" if self.profile.segPhase == 1 else "Ramp"))
+
+            if self.profile.type == "ramp-hold":
                 # Update the schedule segment
-                self.profile.update_seg(self.temp_sensor.temperature)
-
-                if self.profile.finished():
-                    self.reset()
-
-    def set_heat2(self, value, pidstart):
-        if value * 1000 >= millis() - pidstart:
-            self.heat = 1.0
-            if gpio_available:
-                log.info("Heat is ON")
-                GPIO.output(config.gpio_heat, GPIO.HIGH)
-        else:
-            self.heat = 0.0
-            if gpio_available:
-                GPIO.output(config.gpio_heat, GPIO.LOW)
+                segment = (self.profile.segNum, self.profile.segPhase)
+                self.profile.update_seg(temperature, now)
+                if segment != (self.profile.segNum, self.profile.segPhase):
+                    self.changed()
+
+            if self.profile.finished():
+                self.reset()
+                return None
+
+            return self.next_deadline()
+
+    def step_autotune(self):
+        self.runtime = self.clock.time() - self.start_time
+        self.target = self.autotune.setpoint
+        self.output.hold(self.autotune.update(self.clock.time(), self.temperature()))
+        if self.autotune.finished:
+            self.reset()
+            return None
+        # Relay decisions only change with new samples, wake up once per sample anyway
+        return self.clock.millis() + self.time_step * 1000
+
+    def step_fault(self):
+        """Keeps the heater off while the sensor is faulted, aborts the run if it stays faulted."""
+        now = self.clock.time()
+        if self.fault_since is None:
+            self.fault_since = now
+            log.error("sensor fault (%s), heater off" % self.temp_sensor.fault)
+            self.changed()
+        self.output.off()
+        if now - self.fault_since >= config.sensor_fault_abort:
+            log.error("sensor faulted for %d s, aborting run" % config.sensor_fault_abort)
+            self.reset()
+            return None
+        # The sensor notifies when it recovers
+        return self.clock.millis() + self.time_step * 1000
+
+    def next_deadline(self):
+        """Time (ms) of the next event the control loop can't learn about from a notify()."""
+        # PID cycle boundary
+        deadlines = [self.profile.pidStart + pid_cycle]
+        # End of the current hold
+        if self.profile.segPhase == 1:
+            deadlines.append(self.profile.holdStart + self.profile.segHolds[self.profile.segNum - 1] * 60000)
+        return min(deadlines)
+
+    def sample_interval(self):
+        """Seconds until the next sensor read, shorter on fast changes and near segment transitions."""
+        slope = self.temp_sensor.slope(slope_window)
+        to_transition = None
+        with self.lock:
+            if self.state == Oven.STATE_RUNNING:
+                to_transition = self.profile.next_transition(
+                    self.runtime, self.clock.millis(), self.temperature(),
+                    slope / 3600 if slope is not None else None)
+        return poll_interval(slope, to_transition, normal=self.time_step)
+
+    def temperature(self):
+        """Temperature the controller acts on.
+
+        With config.estimator_control the estimate predicted to the current
+        time, the last sample otherwise.
+        """
+        if self.estimator and config.estimator_control:
+            estimate = self.estimator.estimate(self.clock.time())
+            if estimate is not None:
+                return estimate[0]
+        return self.temp_sensor.temperature
+
+    def fuse(self):
+        """Feeds a new sensor sample to the estimator."""
+        sample = self.temp_sensor.samples.latest()
+        if sample is not None and sample[0] != self.fused:
+            self.fused = sample[0]
+            self.estimator.update(*sample)
+
+    def set_heat(self, level):
+        """Follows the heater output, the SSR edges are timed by HeaterOutput."""
+        self.heat = float(level)
+        if self.estimator:
+            self.estimator.set_level(self.clock.time(), self.heat)
+        self.changed()
 
     def get_state(self):
         state = {
@@ -172,92 +373,212 @@ class Oven(threading.Thread):
             'state': self.state,
             'heat': self.heat,
             'totaltime': self.profile.get_duration() if self.profile else 0,
+            'sample_age': self.temp_sensor.samples.age(self.clock.time()),
+            'slope': self.temp_sensor.slope(slope_window),
+            'fault': self.temp_sensor.fault,
 
         }
+        if self.estimator and self.estimator.x is not None:
+            now = self.clock.time()
+            t_oven, t_heat = self.estimator.estimate(now)
+            state['estimate'] = {
+                'temperature': t_oven,
+                'element': t_heat,
+                # instantaneous, it follows the heater switching
+                'slope': self.estimator.slope(now),
+                'innovation': self.estimator.innovation,
+            }
+        if self.temp_sensor.guard:
+            state['sensor'] = self.temp_sensor.guard.metrics()
+        if self.temp_sensor.channels:
+            state['channels'] = self.temp_sensor.channels
+        if self.autotune:
+            state['autotune'] = {
+                'setpoint': self.autotune.setpoint,
+                'finished': self.autotune.finished,
+                'result': self.autotune.result,
+                'error': self.autotune.error,
+            }
         return state
 
 
 class TempSensor(threading.Thread):
-    def __init__(self, time_step):
+    def __init__(self, time_step, clock=None):
         threading.Thread.__init__(self)
         self.daemon = True
         self.temperature = 0
         self.time_step = time_step
+        self.clock = clock or MonotonicClock()
+        # Timestamped history of the published samples, readable from any thread
+        self.samples = SampleRing(config.sensor_history)
+        # Latest {name: {'temperature', 'reference', 'error'}} of all thermocouples
+        # when there is more than one, replaced as a whole on every pass
+        self.channels = {}
+        # Reason the sensor can't be trusted, None while it can
+        self.fault = None
+        # SensorGuard of sensors that can fail
+        self.guard = None
+        # Called (without arguments) whenever a new sample is available or the fault changes
+        self.listeners = []
+        # Returns the seconds to wait before the next read, time_step if not set
+        self.scheduler = None
+
+    def publish(self, temperature):
+        self.samples.append(self.clock.time(), temperature)
+        self.temperature = temperature
+        self.fault = None
+        for listener in self.listeners:
+            listener()
+
+    def set_fault(self, fault):
+        if fault != self.fault:
+            self.fault = fault
+            for listener in self.listeners:
+                listener()
+
+    def slope(self, window):
+        """Rate of change over the last window seconds in degrees per hour, None if unknown."""
+        slope = self.samples.slope(window)
+        return slope * 3600 if slope is not None else None
 
 
 class TempSensorReal(TempSensor):
-    def __init__(self, time_step):
-        TempSensor.__init__(self, time_step)
+    def __init__(self, time_step, clock=None, gpio=None):
+        TempSensor.__init__(self, time_step, clock)
+        # Seconds between oversampled reads, the MAX6675 only has a new value once per conversion
+        self.read_spacing = 0
         if config.max6675:
             log.info("init MAX6675")
+            self.read_spacing = CONVERSION_TIME
             self.thermocouple = MAX6675(config.gpio_sensor_cs,
                                         config.gpio_sensor_clock,
                                         config.gpio_sensor_data,
-                                        config.temp_scale)
-
-        if config.max31855:
+                                        config.temp_scale,
+                                        gpio=gpio,
+                                        clock=self.clock)
+
+        self.bus = None
+        if config.max31855 and config.gpio_sensor_channels:
+            log.info("init MAX31855 bus, %d channels" % (len(config.gpio_sensor_channels) + 1))
+            self.bus = MAX31855Bus([("main", config.gpio_sensor_cs)] + list(config.gpio_sensor_channels),
+                                   config.gpio_sensor_clock,
+                                   config.gpio_sensor_data,
+                                   config.temp_scale,
+                                   gpio=gpio,
+                                   linearize=config.max31855_linearize)
+        elif config.max31855:
             log.info("init MAX31855")
             self.thermocouple = MAX31855(config.gpio_sensor_cs,
                                          config.gpio_sensor_clock,
                                          config.gpio_sensor_data,
-                                         config.temp_scale)
+                                         config.temp_scale,
+                                         gpio=gpio,
+                                         linearize=config.max31855_linearize)
 
         if config.max31855spi:
             log.info("init MAX31855-spi")
             self.thermocouple = MAX31855SPI(spi_dev=SPI.SpiDev(port=0, device=config.spi_sensor_chip_id))
 
+        # A retry sooner than read_spacing would get the cached frame of the failed read again
+        self.guard = SensorGuard(config.sensor_retries, max(config.sensor_retry_delay, self.read_spacing),
+                                 config.sensor_hold_max, self.clock)
+
     def run(self):
         while True:
             try:
-                self.temperature = self.thermocouple.get()
+                temperature = self.guard.read(self.sample)
+                # None: holding the last good value, it stays published
+                if temperature is not None:
+                    self.publish(temperature)
+            except SensorFault as e:
+                self.set_fault(e.value)
             except Exception:
                 log.exception("problem reading temp")
-            time.sleep(self.time_step)
+            self.clock.sleep(self.next_interval())
+
+    def next_interval(self):
+        """Seconds until the next read, time_step if the scheduler fails, so the thread keeps sampling."""
+        if self.scheduler:
+            try:
+                return self.scheduler()
+            except Exception:
+                log.exception("problem scheduling the next read")
+        return self.time_step
+
+    def sample(self):
+        readings = []
+        for i in range(config.sensor_oversample):
+            if i and self.read_spacing:
+                self.clock.sleep(self.read_spacing)
+            readings.append(self.read())
+        return REDUCERS[config.sensor_reduce](readings) if len(readings) > 1 else readings[0]
+
+    def read(self):
+        '''Temperature of the controlling thermocouple, all channels in one pass if there are several.'''
+        if self.bus is None:
+            return self.thermocouple.get()
+        self.channels = self.bus.read()
+        main = self.channels['main']
+        if main['error']:
+            raise MAX31855Error(main['error'])
+        return main['temperature']
 
 
 class TempSensorSimulate(TempSensor):
-    def __init__(self, oven, time_step, sleep_time):
-        TempSensor.__init__(self, time_step)
+    """Two-node (heat element, oven) thermal model of the kiln.
+
+    sleep_time is the interval between samples. step() advances the model to
+    the current clock time with the exact discretization from thermal.py, so
+    any interval is a single step; time_step is kept for the TempSensor
+    interface only. The heater level is piecewise constant between edges:
+    set_level() follows the oven's output and integrates the old level up
+    to each edge, so edges between two samples are accounted for exactly.
+    """
+
+    def __init__(self, oven, time_step, sleep_time, clock=None, params=None):
+        TempSensor.__init__(self, time_step, clock)
         self.oven = oven
         self.sleep_time = sleep_time
+        self.params = params or model_params()
+        self.model = ExactStep(self.params)
+
+        self.t = self.params['t_env']  # deg C  temp in oven
+        self.t_h = self.t  # deg C temp of heat element
+        self.temperature = self.t
+        self.last = self.clock.time()
+        # Heater level since self.last
+        self.level = float(oven.output.level)
+        self.lock = threading.Lock()
+        oven.output.listeners.append(self.set_level)
 
     def run(self):
-        t_env = config.sim_t_env
-        c_heat = config.sim_c_heat
-        c_oven = config.sim_c_oven
-        p_heat = config.sim_p_heat
-        R_o_nocool = config.sim_R_o_nocool
-        R_o_cool = config.sim_R_o_cool
-        R_ho_noair = config.sim_R_ho_noair
-        R_ho_air = config.sim_R_ho_air
-
-        t = t_env  # deg C  temp in oven
-        t_h = t  # deg C temp of heat element
         while True:
-            # heating energy
-            Q_h = p_heat * self.time_step * self.oven.heat
-
-            # temperature change of heat element by heating
-            t_h += Q_h / c_heat
-
-            R_ho = R_ho_noair
-
-            # energy flux heat_el -> oven
-            p_ho = (t_h - t) / R_ho
-
-            # temperature change of oven and heat el
-            t += p_ho * self.time_step / c_oven
-            t_h -= p_ho * self.time_step / c_heat
-
-            # energy flux oven -> env
-
-            p_env = (t - t_env) / R_o_nocool
-
-            # temperature change of oven by cooling to env
-            t -= p_env * self.time_step / c_oven
-            log.debug("energy sim: -> %dW heater: %.0f -> %dW oven: %.0f -> %dW env" % (
-                int(p_heat * self.oven.heat), t_h, int(p_ho), t, int(p_env)))
-            self.temperature = t
+            self.step()
+            self.clock.sleep(self.sleep_time)
+
+    def step(self):
+        self.integrate_to(self.clock.time())
+        log.debug("energy sim: -> %dW heater: %.0f -> %dW oven: %.0f -> %dW env" % (
+            int(self.params['p_heat'] * self.oven.heat), self.t_h,
+            int((self.t_h - self.t) / self.params['R_ho_noair']),
+            self.t, int((self.t - self.params['t_env']) / self.params['R_o_nocool'])))
+        self.publish(self.t)
+
+    def set_level(self, level):
+        """The heater switched to level (0..1) now."""
+        with self.lock:
+            self.advance(self.clock.time())
+            self.level = float(level)
+
+    def integrate_to(self, now):
+        """Advances the model to now without publishing a sample."""
+        with self.lock:
+            self.advance(now)
+
+    def advance(self, now):
+        if now > self.last:
+            self.t, self.t_h = self.model.step(self.t, self.t_h, self.level, now - self.last)
+            self.last = now
 
 
 class Profile:
@@ -270,7 +591,7 @@ class Profile:
         self.segTemps = []
         self.segHolds = []
         self.segPhase = 0
-        # Exact time the hold phase of the segment started (ms).  Based on now().
+        # Exact time the hold phase of the segment started (ms).  Based on the oven's clock.
         self.holdStart = 0
         self.segNum = 0
         self.rampStart = 0
@@ -299,40 +620,63 @@ class Profile:
         self.numSegments = len(self.segTemps)
         self.running = False
         self.lastStateChange = 0
-        self.totalTime = self.data[-1][0]
+        self.compile()
+        self.totalTime = self.times[-1]
         self.overtime = 0
         log.info(str(self.timeDiffs))
         log.info(str(self.totalTime))
 
-    def update_seg(self, temp_sensor):
+    def update_seg(self, temp_sensor, now):
         # Start the hold phase
         if ((self.segPhase == 0 and self.segRamps[self.segNum - 1] < 0 and temp_sensor <= (
                 self.segTemps[self.segNum - 1] + temp_range)) or
                 (self.segPhase == 0 and self.segRamps[self.segNum - 1] >= 0 and temp_sensor >= (
                         self.segTemps[self.segNum - 1] - temp_range))):
             self.segPhase = 1
-            self.holdStart = millis()
+            self.holdStart = now
 
         # Go to the next segment
-        if self.segPhase == 1 and (millis() - self.holdStart >= self.segHolds[self.segNum - 1] * 60000):
+        if self.segPhase == 1 and (now - self.holdStart >= self.segHolds[self.segNum - 1] * 60000):
             self.segNum = self.segNum + 1
             self.segPhase = 0
-            self.rampStart = millis()
+            self.rampStart = now
 
         # Check if complete
-        if self.segNum - 1 > self.numSegments:
+        if self.segNum > self.numSegments:
             self.running = False
 
-    def update_pid(self, temp_sensor):
+    def next_transition(self, runtime, now, temperature, slope):
+        """Seconds until the schedule is expected to change segment, None if unknown.
+
+        runtime and now (ms) as for get_target_temperature and update_seg,
+        slope is the current rate of change in degrees per second.
+        """
+        if self.type == "profile":
+            i = bisect.bisect_right(self.times, runtime)
+            return self.times[i] - runtime if i < len(self.times) else None
+        if self.segNum < 1 or self.segNum > self.numSegments:
+            return None
+        if self.segPhase == 1:
+            return (self.holdStart + self.segHolds[self.segNum - 1] * 60000 - now) / 1000.0
+        # Ramping: update_seg starts the hold within temp_range of the segment temperature
+        if self.segRamps[self.segNum - 1] >= 0:
+            remaining = self.segTemps[self.segNum - 1] - temp_range - temperature
+        else:
+            remaining = self.segTemps[self.segNum - 1] + temp_range - temperature
+        if not slope or remaining / slope < 0:
+            return None
+        return remaining / slope
+
+    def update_pid(self, temp_sensor, now):
         # Get the last target temperature
         if self.segNum == 1:  # Set to terhmocouple temperature for first segment
-            self.lastTemp = 75
+            self.lastTemp = ramp_hold_start_temp
         else:
             self.lastTemp = self.segTemps[self.segNum - 2]
 
         # Calculate the new set point value.  Don't set above / below target temp
         if self.segPhase == 0:
-            ramp_hours = (millis() - self.rampStart) / 3600000.0
+            ramp_hours = (now - self.rampStart) / 3600000.0
             calc_set_point = self.lastTemp + (self.segRamps[self.segNum - 1] * ramp_hours)  # Ramp
             if self.segRamps[self.segNum - 1] >= 0 and calc_set_point >= self.segTemps[self.segNum - 1]:
                 calc_set_point = self.segTemps[self.segNum - 1]
@@ -345,6 +689,58 @@ class Profile:
 
         return calc_set_point
 
+    def compile(self):
+        """Builds the nominal schedule as a cumulative (times, temps) table.
+
+        Ramp-hold segments are laid out as ramp then hold, starting at
+        ramp_hold_start_temp. Where several points share a time only the last
+        one is kept, so self.times is strictly increasing and the table can be
+        searched by bisection.
+        """
+        if self.type == "profile":
+            points = [(float(t), float(temp)) for t, temp in self.data]
+        else:
+            t = 0.0
+            temp = float(ramp_hold_start_temp)
+            points = [(t, temp)]
+            for ramp, seg_temp, hold in zip(self.segRamps, self.segTemps, self.segHolds):
+                # a ramp pointing away from the target ends right away, like update_pid does
+                if ramp and (seg_temp - temp) * ramp > 0:
+                    t += (seg_temp - temp) / float(ramp) * 3600
+                points.append((t, float(seg_temp)))
+                t += hold * 60
+                points.append((t, float(seg_temp)))
+                temp = seg_temp
+
+        self.times = []
+        self.temps = []
+        for t, temp in points:
+            if self.times and t <= self.times[-1]:
+                self.temps[-1] = temp
+            else:
+                self.times.append(t)
+                self.temps.append(temp)
+
+    def target_at(self, t):
+        """Nominal target temperature t seconds into the schedule, O(log n)."""
+        i = bisect.bisect_right(self.times, t)
+        if i == 0:
+            return self.temps[0]
+        if i == len(self.times):
+            return self.temps[-1]
+        t0, t1 = self.times[i - 1], self.times[i]
+        return self.temps[i - 1] + (self.temps[i] - self.temps[i - 1]) * (t - t0) / (t1 - t0)
+
+    def targets_at(self, times):
+        """target_at() for a sequence of times, vectorized when numpy is available."""
+        if numpy_available:
+            return np.interp(times, self.times, self.temps)
+        return [self.target_at(t) for t in times]
+
+    def segment_at(self, t):
+        """Index of the table segment t seconds into the schedule."""
+        return max(0, min(bisect.bisect_right(self.times, t), len(self.times) - 1) - 1)
+
     def finished(self):
         return not self.running
 
@@ -383,10 +779,12 @@ class Profile:
                 self.totalTime += self.overtime
                 self.overtime = 0
 
-                targetTemp = self.get_intermediate_temperature(0)
-
                 if self.currentState == self.numStates:
+                    # Past the last point, there is nothing to interpolate
                     self.running = False
+                    targetTemp = self.timeDiffs[-1][1]
+                else:
+                    targetTemp = self.get_intermediate_temperature(0)
             else:
                 targetTemp = self.timeDiffs[self.currentState][1]
                 self.overtime = relativeTime - minimumTime
@@ -404,7 +802,18 @@ class Profile:
 
         return targetTemp
 
-
-"""
-Tests to see if the target temperature has been acquired.
-"""
+    """
+    Tests to see if the target temperature has been acquired.
+    """
+    def check_target(self, temperature):
+        previous, next = self.get_surrounding_points()
+        result = True
+
+        if previous[1] < next[1]:
+            if temperature < next[1]:
+                result = False
+        elif previous[1] > next[1]:
+            if temperature > next[1]:
+                result = False
+
+        return result
@@ -1,77 +1,238 @@
-import threading,logging,json,time,datetime
+import threading,logging,json,datetime,collections
+import gevent
+import gevent.event
 from oven2 import Oven
+from ringbuffer import ColumnLog
+from downsample import lttb
+import binframe
+from pubsub import Hub, STATUS, EVENTS
 log = logging.getLogger(__name__)
 
+# state fields kept for the graph of the current firing
+log_fields = ['runtime', 'temperature', 'target', 'heat']
+# rows per field, the log thins itself out to fit (8 bytes per value)
+log_capacity = 2048
+# messages queued per client before the queued states are coalesced
+queue_size = 10
+# coalescing rounds without a single message getting through before the client is dropped
+max_overflows = 3
+# backlog points sent to clients that don't ask for a number, and per message
+backlog_points = 1000
+backlog_chunk = 500
+# status ticks between full states, the ticks in between only send the changed fields
+keyframe_interval = 30
+
+class Subscriber(object):
+    '''Outbound message queue of one status websocket, drained by its own greenlet.
+
+    send() can be called from any thread and never blocks: it appends to the
+    queue and wakes the hub through an async watcher, the greenlet then
+    writes to the socket. A client that can't keep up doesn't hold up the
+    others: when its queue is full the queued states are dropped in favour
+    of the newest one, and after max_overflows such rounds without any
+    progress the client is closed.
+
+    Must be created in the thread running the gevent hub.
+    '''
+    def __init__(self, wsock, size=queue_size, overflows=max_overflows):
+        self.wsock = wsock
+        self.size = size
+        self.max_overflows = overflows
+        self.overflows = 0
+        self.closed = False
+        # set when queued messages were dropped, the client needs a full state again
+        self.resync = False
+        # (message, coalescable)
+        self.queue = collections.deque()
+        self.lock = threading.Lock()
+        self.ready = gevent.event.Event()
+        self.wakeup = gevent.get_hub().loop.async_()
+        self.wakeup.start(self.wake)
+        self.greenlet = gevent.spawn(self.drain)
+
+    def send(self, message, coalescable=True):
+        '''Queues message, returns False if the client is gone.'''
+        if self.closed:
+            return False
+        with self.lock:
+            if len(self.queue) >= self.size:
+                self.overflows += 1
+                if self.overflows > self.max_overflows:
+                    log.warning("dropping status client %s, it stopped reading" % self.wsock)
+                    self.closed = True
+                else:
+                    # the newest state supersedes the queued ones
+                    self.queue = collections.deque(item for item in self.queue if not item[1])
+                    self.resync = True
+            if not self.closed:
+                self.queue.append((message, coalescable))
+        self.wakeup.send()
+        return not self.closed
+
+    def close(self):
+        self.closed = True
+        self.wakeup.send()
+
+    def wake(self):
+        # runs in the hub, which must not block
+        if self.closed:
+            self.wakeup.stop()
+            gevent.spawn(self.shutdown)
+        else:
+            self.ready.set()
+
+    def shutdown(self):
+        self.greenlet.kill()
+        # the close frame can't get through to a client that stopped reading either
+        with gevent.Timeout(1, False):
+            try:
+                self.wsock.close()
+            except Exception:
+                pass
+
+    def drain(self):
+        try:
+            while not self.closed:
+                self.ready.wait()
+                self.ready.clear()
+                while not self.closed:
+                    with self.lock:
+                        if not self.queue:
+                            break
+                        message, coalescable = self.queue.popleft()
+                    self.wsock.send(message)
+                    self.overflows = 0
+        except Exception:
+            log.error("could not write to socket %s" % self.wsock)
+            self.close()
+
 class OvenWatcher(threading.Thread):
-    def __init__(self,oven):
+    def __init__(self,oven,hub=None):
         self.last_profile = None
-        self.last_log = []
+        self.last_log = ColumnLog(log_fields, log_capacity)
         self.started = None
         self.recording = False
-        self.observers = []
+        # the status websockets are subscribers of its STATUS topic
+        self.hub = hub or Hub()
+        # held while sending a tick, so a new observer's keyframe and the deltas after it line up
+        self.status_lock = threading.Lock()
+        # status stream: sequence number and state of the last tick
+        self.seq = 0
+        self.last_state = None
         threading.Thread.__init__(self)
         self.daemon = True
-        self.log_skip_counter = 0
 
         self.oven = oven
         self.start()
 
     def run(self):
+        version = self.oven.version
         while True:
             oven_state = self.oven.get_state()
             
             if oven_state.get("state") == Oven.STATE_RUNNING:
-                if self.log_skip_counter==0:
-                    self.last_log.append(oven_state)
+                self.last_log.append(oven_state)
             else:
                 self.recording = False
             self.notify_all(oven_state)
-            self.log_skip_counter = (self.log_skip_counter +1)%20
-            time.sleep(self.oven.time_step)
+            # changes are pushed as they happen, the time_step tick is only a heartbeat
+            version = self.oven.wait_change(version, self.oven.time_step)
     
     def record(self, profile):
         self.last_profile = profile
-        self.last_log = []
+        self.last_log.clear()
         self.started = datetime.datetime.now()
         self.recording = True
         #we just turned on, add first state for nice graph
         self.last_log.append(self.oven.get_state())
 
-    def add_observer(self,observer):
+    def add_observer(self,observer,points=backlog_points,binary=False,topics=(EVENTS,)):
+        '''Subscribes a status websocket to STATUS and topics, returns its Subscriber.
+
+        The backlog of the current firing goes out first, downsampled to
+        at most points samples, as binary column frames if binary is set.
+        Unsubscribe it from self.hub when the socket closes.
+        '''
+        subscriber = Subscriber(observer)
+        # the backlog is never coalesced away
+        for message in self.backlog(points, binary=binary):
+            subscriber.send(message, coalescable=False)
+
+        for topic in topics:
+            self.hub.subscribe(topic, subscriber)
+        with self.status_lock:
+            if self.last_state is not None:
+                subscriber.send(self.keyframe(self.seq, self.last_state))
+            self.hub.subscribe(STATUS, subscriber)
+        return subscriber
+
+    def backlog(self, points=backlog_points, chunk=backlog_chunk, binary=False):
+        '''The current firing as "backlog" messages of at most chunk samples, in time order.
+
+        The log is reduced to points samples with LTTB on the temperature
+        curve, so peaks and the shape of ramps and holds survive. Only the
+        first message carries the profile. Messages are JSON, or with
+        binary binframe frames of float32 columns and the rest in the
+        metadata.
+        '''
         if self.last_profile:
+            # the compiled table is the schedule as (time, temperature) points for either profile type
             p = {
                 "name": self.last_profile.name,
-                "data": self.last_profile.data, 
+                "data": list(zip(self.last_profile.times, self.last_profile.temps)),
                 "type" : "profile"
             }
         else:
             p = None
         
-        backlog = {
-            'type': "backlog",
-            'profile': p,
-            'log': self.last_log,
-            #'started': self.started
-        }
-        print(backlog)
-        backlog_json = json.dumps(backlog)
-        try:
-            print(backlog_json)
-            observer.send(backlog_json)
-        except:
-            log.error("Could not send backlog to new observer")
-        
-        self.observers.append(observer)
+        columns = self.last_log.to_columns()
+        keep = lttb(columns['runtime'], columns['temperature'], points)
+        messages = []
+        for start in range(0, max(len(keep), 1), chunk):
+            indices = keep[start:start + chunk]
+            # {field: [values]}
+            log_columns = dict((field, [values[i] for i in indices]) for field, values in columns.items())
+            backlog = {'type': "backlog"}
+            if start == 0:
+                backlog['profile'] = p
+            if binary:
+                messages.append(binframe.encode(log_columns, log_fields, backlog))
+            else:
+                backlog['log'] = log_columns
+                messages.append(json.dumps(backlog))
+        return messages
+
+    def keyframe(self, seq, state):
+        return json.dumps({'type': "keyframe", 'seq': seq, 'state': state})
+
+    def delta(self, seq, previous, state):
+        changes = dict((key, value) for key, value in state.items() if previous.get(key) != value)
+        removed = [key for key in previous if key not in state]
+        return json.dumps({'type': "delta", 'seq': seq, 'changes': changes, 'removed': removed})
 
     def notify_all(self,message):
-        message_json = json.dumps(message)
-        log.debug("sending to %d clients: %s"%(len(self.observers),message_json))
-        for wsock in self.observers:
-            if wsock:
-                try:
-                    wsock.send(message_json)
-                except:
-                    log.error("could not write to socket %s"%wsock)
-                    self.observers.remove(wsock)
-            else:
-                self.observers.remove(wsock)
+        '''Sends the state of this tick: a keyframe every keyframe_interval ticks and
+        to clients that lost messages, the changed fields to everybody else.
+        Both are encoded at most once per tick.'''
+        with self.status_lock:
+            previous = self.last_state
+            self.seq += 1
+            self.last_state = message
+            encoded = {}
+            if previous is None or self.seq % keyframe_interval == 0:
+                encoded['delta'] = encoded['keyframe'] = self.keyframe(self.seq, message)
+            subscribers = self.hub.subscribers(STATUS)
+            for subscriber in subscribers:
+                kind = 'keyframe' if subscriber.resync else 'delta'
+                if kind not in encoded:
+                    encoded[kind] = (self.keyframe(self.seq, message) if kind == 'keyframe'
+                                     else self.delta(self.seq, previous, message))
+                subscriber.resync = False
+                if not subscriber.send(encoded[kind]):
+                    self.hub.unsubscribe(subscriber)
+        log.debug("sent state %d to %d clients" % (self.seq, len(subscribers)))
+
+    def publish_event(self, event, **fields):
+        '''Tells the status clients about event (e.g. "RUN"), right away.'''
+        fields.update({'type': "event", 'event': event})
+        self.hub.publish(EVENTS, json.dumps(fields))
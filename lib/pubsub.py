@@ -0,0 +1,70 @@
+import threading
+import logging
+
+log = logging.getLogger(__name__)
+
+# topics of the status websockets
+STATUS = "status"
+EVENTS = "events"
+
+
+class Hub(object):
+    '''Topic based fan-out of messages to subscribers.
+
+    A subscriber is anything with send(message) that returns False once it
+    is gone, like ovenWatcher.Subscriber; it should not block, publish()
+    runs in the publisher's thread. Topics are plain strings and exist as
+    long as they have subscribers, e.g. "status", "events" or a per kiln
+    "status/<name>".
+
+    The subscribers of a topic are a tuple that is replaced, never
+    modified, under the lock (copy-on-write). subscribe() and unsubscribe()
+    can be called from any thread or greenlet, publish() iterates a
+    snapshot without taking the lock, so fan-out never waits for a
+    subscriber coming or going.
+    '''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # {topic: (subscriber, ...)}
+        self.topics = {}
+
+    def subscribe(self, topic, subscriber):
+        with self.lock:
+            subscribers = self.topics.get(topic, ())
+            if subscriber not in subscribers:
+                self.topics[topic] = subscribers + (subscriber,)
+
+    def unsubscribe(self, subscriber, topic=None):
+        '''Removes subscriber from topic, or from all topics.'''
+        with self.lock:
+            for name in ([topic] if topic is not None else list(self.topics)):
+                subscribers = tuple(s for s in self.topics.get(name, ()) if s is not subscriber)
+                if subscribers:
+                    self.topics[name] = subscribers
+                else:
+                    self.topics.pop(name, None)
+
+    def subscribers(self, topic):
+        '''Snapshot of the subscribers of topic.'''
+        return self.topics.get(topic, ())
+
+    def publish(self, topic, message):
+        '''Sends message to every subscriber of topic, returns the number that took it.
+
+        Subscribers that are gone are unsubscribed.
+        '''
+        delivered = 0
+        gone = []
+        for subscriber in self.subscribers(topic):
+            if subscriber.send(message):
+                delivered += 1
+            else:
+                gone.append(subscriber)
+        for subscriber in gone:
+            self.unsubscribe(subscriber)
+        return delivered
+
+    def counts(self):
+        '''{topic: number of subscribers}'''
+        return dict((topic, len(subscribers)) for topic, subscribers in self.topics.items())
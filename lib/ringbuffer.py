@@ -0,0 +1,166 @@
+import threading
+from array import array
+
+
+class SampleRing(object):
+    '''Fixed size ring buffer of (time, value) samples backed by preallocated arrays.
+
+    There is a single writer (the sensor thread). Readers never lock: the
+    writer fills a slot first and only then bumps self.count, so the newest
+    count samples are always complete, and a reader copying several samples
+    re-checks count afterwards and drops the ones that may have been
+    overwritten meanwhile.
+    '''
+
+    def __init__(self, capacity=256):
+        self.capacity = capacity
+        self.times = array('d', [0.0] * capacity)
+        self.values = array('d', [0.0] * capacity)
+        # total number of samples ever written
+        self.count = 0
+
+    def append(self, t, value):
+        i = self.count % self.capacity
+        self.times[i] = t
+        self.values[i] = value
+        self.count += 1
+
+    def latest(self):
+        '''Newest (time, value), or None before the first sample.'''
+        n = self.count
+        if n == 0:
+            return None
+        i = (n - 1) % self.capacity
+        return self.times[i], self.values[i]
+
+    def age(self, now):
+        '''Seconds since the newest sample, or None before the first sample.'''
+        sample = self.latest()
+        if sample is None:
+            return None
+        return now - sample[0]
+
+    def samples(self, n=None):
+        '''Up to n newest samples (all there are by default) as a list of (time, value), oldest first.'''
+        end = self.count
+        # keep one slot of slack for the write that may be in progress
+        available = min(end, self.capacity - 1)
+        if n is None or n > available:
+            n = available
+        result = [(self.times[k % self.capacity], self.values[k % self.capacity]) for k in range(end - n, end)]
+        # drop what the writer may have lapped while we were copying, including
+        # the slot of a write in progress
+        unsafe = self.count - self.capacity - (end - n) + 1
+        return result[unsafe:] if unsafe > 0 else result
+
+    def since(self, t):
+        '''Samples taken at or after time t, oldest first.'''
+        end = self.count
+        limit = min(end, self.capacity - 1)
+        n = 0
+        # walk back from the newest sample, only the window gets copied
+        while n < limit and self.times[(end - n - 1) % self.capacity] >= t:
+            n += 1
+        return [sample for sample in self.samples(n) if sample[0] >= t]
+
+    def slope(self, window, now=None):
+        '''Least squares rate of change (value per second) over the last window seconds.
+
+        Returns None with fewer than two samples in the window.
+        '''
+        if now is None:
+            latest = self.latest()
+            if latest is None:
+                return None
+            now = latest[0]
+        points = self.since(now - window)
+        if len(points) < 2:
+            return None
+        n = float(len(points))
+        mean_t = sum(t for t, v in points) / n
+        mean_v = sum(v for t, v in points) / n
+        var = sum((t - mean_t) ** 2 for t, v in points)
+        if var == 0:
+            return None
+        return sum((t - mean_t) * (v - mean_v) for t, v in points) / var
+
+
+class ColumnLog(object):
+    '''Bounded log of numeric records, one preallocated float array per field.
+
+    It keeps a whole firing in fixed memory: when the capacity is reached
+    every second row is dropped and from then on only every stride-th
+    record is stored, so the time resolution halves instead of the start
+    of the firing getting lost.
+    '''
+
+    def __init__(self, fields, capacity=2048):
+        self.fields = list(fields)
+        self.capacity = capacity
+        self.columns = dict((field, array('d', [0.0] * capacity)) for field in self.fields)
+        self.length = 0
+        self.stride = 1
+        # records offered since the last clear(), stored or not
+        self.seen = 0
+        # append() compacts the arrays in place, readers must not copy meanwhile
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return self.length
+
+    def append(self, record):
+        '''Stores the fields of record (a dict, e.g. from Oven.get_state) if it falls on the stride.'''
+        with self.lock:
+            self.seen += 1
+            if (self.seen - 1) % self.stride:
+                return
+            if self.length == self.capacity:
+                self.decimate()
+            for field in self.fields:
+                self.columns[field][self.length] = record[field]
+            self.length += 1
+
+    def decimate(self):
+        half = (self.length + 1) // 2
+        for column in self.columns.values():
+            column[:half] = column[0:self.length:2]
+        self.length = half
+        self.stride *= 2
+
+    def clear(self):
+        with self.lock:
+            self.length = 0
+            self.stride = 1
+            self.seen = 0
+
+    def column(self, field):
+        '''Copy of one field as an array('d').'''
+        with self.lock:
+            return self.columns[field][:self.length]
+
+    def to_columns(self, fields=None):
+        '''{field: list of values} for the given fields, all of them by default.'''
+        with self.lock:
+            return dict((field, self.columns[field][:self.length].tolist()) for field in (fields or self.fields))
+
+
+def median(values):
+    ordered = sorted(values)
+    n = len(ordered)
+    if n % 2:
+        return ordered[n // 2]
+    return (ordered[n // 2 - 1] + ordered[n // 2]) / 2.0
+
+
+def trimmed_mean(values, trim=0.25):
+    '''Mean of values without the lowest and highest trim fraction.'''
+    ordered = sorted(values)
+    k = int(len(ordered) * trim)
+    kept = ordered[k:len(ordered) - k] or ordered
+    return sum(kept) / float(len(kept))
+
+
+REDUCERS = {
+    'median': median,
+    'trimmed': trimmed_mean,
+}
@@ -0,0 +1,117 @@
+import logging
+import collections
+
+from clock import MonotonicClock
+
+log = logging.getLogger(__name__)
+
+
+class SensorGuard(object):
+    '''Fault handling around the reads of a thermocouple driver.
+
+    A failed read is retried right away in a short burst. When the whole
+    burst fails the caller keeps its last good value, but only for max_hold
+    seconds after it was read; from then on the sensor is faulted until a
+    read succeeds again. The state is one of
+
+    - OK:    the last read succeeded
+    - HOLD:  reads fail, the last good value is recent enough to control on
+    - FAULT: reads fail and the last good value is too old
+    '''
+    STATE_OK = "OK"
+    STATE_HOLD = "HOLD"
+    STATE_FAULT = "FAULT"
+
+    def __init__(self, retries=3, retry_delay=0.05, max_hold=30, clock=None):
+        '''
+        Parameters:
+        - retries:     extra attempts after a failed read
+        - retry_delay: seconds between the attempts of a burst
+        - max_hold:    seconds the last good value may be held
+        - clock:       (optional) time source (MonotonicClock (default))
+        '''
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.max_hold = max_hold
+        self.clock = clock or MonotonicClock()
+        self.state = SensorGuard.STATE_OK
+        self.error = None
+        # time of the last good read
+        self.last_good = None
+        self.reads = 0
+        self.attempts = 0
+        self.errors = collections.Counter()
+        self.recoveries = 0
+        self.holds = 0
+        self.faults = 0
+        # time from the first failed attempt to the successful retry (s)
+        self.retry_latency_total = 0.0
+        self.retry_latency_max = 0.0
+
+    def read(self, read):
+        '''Calls read() until it succeeds, at most 1 + retries times.
+
+        Returns the value read, or None while holding: reads failed but the
+        last good value is younger than max_hold. Raises SensorFault once
+        it's older than that.
+        '''
+        self.reads += 1
+        start = self.clock.time()
+        error = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self.clock.sleep(self.retry_delay)
+            self.attempts += 1
+            try:
+                value = read()
+            except Exception as e:
+                error = str(getattr(e, 'value', e))
+                self.errors[error] += 1
+                continue
+            now = self.clock.time()
+            if attempt:
+                latency = now - start
+                self.recoveries += 1
+                self.retry_latency_total += latency
+                self.retry_latency_max = max(self.retry_latency_max, latency)
+            if self.state != SensorGuard.STATE_OK:
+                log.warning("sensor recovered after %s" % self.state)
+            self.state = SensorGuard.STATE_OK
+            self.error = None
+            self.last_good = now
+            return value
+
+        self.error = error
+        if self.last_good is not None and self.clock.time() - self.last_good <= self.max_hold:
+            if self.state == SensorGuard.STATE_OK:
+                log.warning("sensor read failed (%s), holding the last good value" % error)
+            self.state = SensorGuard.STATE_HOLD
+            self.holds += 1
+            return None
+        if self.state != SensorGuard.STATE_FAULT:
+            log.error("sensor fault: %s" % error)
+            self.faults += 1
+        self.state = SensorGuard.STATE_FAULT
+        raise SensorFault(error)
+
+    def metrics(self):
+        return {
+            'state': self.state,
+            'error': self.error,
+            'reads': self.reads,
+            'attempts': self.attempts,
+            'errors': dict(self.errors),
+            'recoveries': self.recoveries,
+            'holds': self.holds,
+            'faults': self.faults,
+            'retry_latency_mean': self.retry_latency_total / self.recoveries if self.recoveries else 0.0,
+            'retry_latency_max': self.retry_latency_max,
+        }
+
+
+class SensorFault(Exception):
+    def __init__(self, value):
+        self.value = value
+
+    def __str__(self):
+        return repr(self.value)
@@ -0,0 +1,90 @@
+import logging
+
+import config
+
+from clock import VirtualClock
+from hal import MemoryGPIO
+from oven2 import Oven
+
+log = logging.getLogger(__name__)
+
+
+class Simulation(object):
+    '''Runs a Profile against the simulated kiln in virtual time.
+
+    The oven, its heater output and the thermal model are created unthreaded
+    on a VirtualClock and stepped from one event to the next (sensor sample,
+    heater edge, control loop deadline), so a firing takes as long as the CPU
+    needs to compute it rather than the length of the firing.
+    '''
+
+    def __init__(self, profile, sample_interval=config.sensor_time_wait, max_hours=48, gains=None):
+        '''
+        Parameters:
+        - profile:         Profile to fire (type "profile" or "ramp-hold")
+        - sample_interval: seconds between simulated sensor samples, one trace entry per sample
+        - max_hours:       give up after this much simulated time
+        - gains:           (optional) (kp, ki, kd) to use instead of the ones in config.py
+        '''
+        self.profile = profile
+        self.sample_interval = sample_interval
+        self.max_time = max_hours * 3600
+        self.clock = VirtualClock()
+        # The heater edges go to memory, never to the real relay
+        self.gpio = MemoryGPIO(self.clock)
+        self.oven = Oven(simulate=True, time_step=sample_interval, clock=self.clock, threaded=False, gains=gains,
+                         gpio=self.gpio)
+        # Total time the heater was on, in seconds
+        self.heater_seconds = 0.0
+
+    def run(self):
+        '''Generator yielding the oven state after every sensor sample until the profile ends.'''
+        clock = self.clock
+        oven = self.oven
+        sensor = oven.temp_sensor
+        output = oven.output
+
+        oven.run_profile(self.profile)
+        next_sample = clock.time()
+        while True:
+            now = clock.time()
+            # The model has to see the heater level up to now before an edge switches it
+            sensor.integrate_to(now)
+            output.step()
+            sampled = now >= next_sample
+            if sampled:
+                sensor.step()
+                next_sample += self.sample_interval
+            deadline = oven.step()
+            # A new pid cycle starts its heater window right away
+            next_edge = output.step()
+            if sampled:
+                yield oven.get_state()
+            if deadline is None:
+                break
+            if now >= self.max_time:
+                log.warning("simulation of %s stopped after %d hours" % (self.profile.name, self.max_time / 3600))
+                break
+
+            events = [deadline / 1000.0, next_sample]
+            if next_edge is not None:
+                events.append(next_edge)
+            next_event = min(events)
+            # the heater level is constant up to the next event
+            self.heater_seconds += oven.heat * max(next_event - now, 0)
+            clock.advance_to(next_event)
+
+    def energy(self):
+        '''Electrical energy used so far in kWh.'''
+        return self.heater_seconds * self.oven.temp_sensor.params['p_heat'] / 3600000.0
+
+    def chunks(self, size=500):
+        '''Like run(), but yields lists of up to size states.'''
+        chunk = []
+        for state in self.run():
+            chunk.append(state)
+            if len(chunk) >= size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
@@ -0,0 +1,182 @@
+import math
+import logging
+
+import config
+
+log = logging.getLogger(__name__)
+
+try:
+    import numpy as np
+
+    numpy_available = True
+except ImportError:
+    numpy_available = False
+
+
+def model_params(**overrides):
+    '''Thermal model parameters from config.py, any of them overridden by keyword.
+
+    Values may be scalars or arrays with one entry per scenario.
+    '''
+    params = {
+        't_env': config.sim_t_env,
+        'c_heat': config.sim_c_heat,
+        'c_oven': config.sim_c_oven,
+        'p_heat': config.sim_p_heat,
+        'R_o_nocool': config.sim_R_o_nocool,
+        'R_o_cool': config.sim_R_o_cool,
+        'R_ho_noair': config.sim_R_ho_noair,
+        'R_ho_air': config.sim_R_ho_air,
+    }
+    for name, value in overrides.items():
+        if name not in params:
+            raise KeyError("unknown model parameter %s" % name)
+        params[name] = value
+    return params
+
+
+class ExactStep(object):
+    '''Exact zero-order-hold discretization of the two-node heater/oven model.
+
+    With x = (t_oven, t_heat) and the heater level held constant over a step
+    the model is linear, x' = A x + b_env + b_heat * level, so a step of dt
+    seconds is exactly
+
+        x(t + dt) = phi x(t) + g_env + g_heat * level
+
+    with phi = exp(A dt) and g = A^-1 (phi - I) b. A is 2x2 with two real
+    negative eigenvalues, so exp(A dt) is evaluated in closed form from the
+    eigenvalues computed once per air/cool mode. Unlike the Euler update this
+    is stable and exact for any step length.
+    '''
+
+    def __init__(self, params=None, air=False, cool=False):
+        p = params or model_params()
+        R_ho = p['R_ho_air'] if air else p['R_ho_noair']
+        R_o = p['R_o_cool'] if cool else p['R_o_nocool']
+        c_oven = p['c_oven']
+        c_heat = p['c_heat']
+        self.A = ((-1.0 / (R_ho * c_oven) - 1.0 / (R_o * c_oven), 1.0 / (R_ho * c_oven)),
+                  (1.0 / (R_ho * c_heat), -1.0 / (R_ho * c_heat)))
+        self.b_env = (p['t_env'] / (R_o * c_oven), 0.0)
+        self.b_heat = (0.0, p['p_heat'] / c_heat)
+
+        (a, b), (c, d) = self.A
+        det = a * d - b * c
+        self.A_inv = ((d / det, -b / det), (-c / det, a / det))
+        half_trace = (a + d) / 2.0
+        root = math.sqrt(max(half_trace * half_trace - det, 0.0))
+        self.l1 = half_trace + root
+        self.l2 = half_trace - root
+        # (phi, g_env, g_heat) per step length
+        self.cache = {}
+
+    def expm(self, dt):
+        '''exp(A dt) by Sylvester's formula.'''
+        (a, b), (c, d) = self.A
+        l1, l2 = self.l1, self.l2
+        e1 = math.exp(l1 * dt)
+        e2 = math.exp(l2 * dt)
+        if l1 - l2 > 1e-12:
+            k1 = (e1 - e2) / (l1 - l2)
+            k0 = e1 - l1 * k1
+        else:
+            # repeated eigenvalue: exp(A dt) = e (I + (A - l I) dt)
+            k1 = e1 * dt
+            k0 = e1 - l1 * k1
+        return ((k0 + k1 * a, k1 * b), (k1 * c, k0 + k1 * d))
+
+    def matrices(self, dt):
+        '''(phi, g_env, g_heat) for a step of dt seconds.'''
+        result = self.cache.get(dt)
+        if result is None:
+            phi = self.expm(dt)
+            (p00, p01), (p10, p11) = phi
+            (i00, i01), (i10, i11) = self.A_inv
+            # gamma = A^-1 (phi - I)
+            gamma = ((i00 * (p00 - 1) + i01 * p10, i00 * p01 + i01 * (p11 - 1)),
+                     (i10 * (p00 - 1) + i11 * p10, i10 * p01 + i11 * (p11 - 1)))
+            g_env = tuple(row[0] * self.b_env[0] + row[1] * self.b_env[1] for row in gamma)
+            g_heat = tuple(row[0] * self.b_heat[0] + row[1] * self.b_heat[1] for row in gamma)
+            result = (phi, g_env, g_heat)
+            # step lengths between heater edges vary, keep the cache bounded
+            if len(self.cache) > 256:
+                self.cache.clear()
+            self.cache[dt] = result
+        return result
+
+    def step(self, t, t_h, level, dt):
+        '''Advances (t_oven, t_heat) by dt seconds at a constant heater level.'''
+        ((p00, p01), (p10, p11)), g_env, g_heat = self.matrices(dt)
+        return (p00 * t + p01 * t_h + g_env[0] + g_heat[0] * level,
+                p10 * t + p11 * t_h + g_env[1] + g_heat[1] * level)
+
+
+def simulate_batch(duty, dt, params=None, t0=None, method="euler"):
+    '''Integrates the two-node heater/oven model of TempSensorSimulate for many scenarios at once.
+
+    Parameters:
+    - duty:   heater level (0..1) per step, shape (n_steps,) shared by all
+              scenarios or (n_scenarios, n_steps)
+    - dt:     step length in seconds
+    - params: dict from model_params(), entries scalar or shape (n_scenarios,)
+    - t0:     (optional) start temperature of oven and heat element, defaults to t_env
+    - method: "euler" for the explicit Euler step of the original
+              TempSensorSimulate, "exact" for the ExactStep discretization
+              (the level is then held constant over each step)
+
+    Returns (t_oven, t_heat), each of shape (n_scenarios, n_steps + 1) with the
+    start temperature in column 0.
+    '''
+    if not numpy_available:
+        raise ImportError("simulate_batch needs numpy")
+    if params is None:
+        params = model_params()
+    duty = np.asarray(duty, dtype=float)
+    p = dict((name, np.asarray(value, dtype=float)) for name, value in params.items())
+
+    shape = np.broadcast_shapes(duty.shape[:-1], *[value.shape for value in p.values()])
+    n_scenarios = shape[0] if shape else 1
+    n_steps = duty.shape[-1]
+    duty = np.broadcast_to(duty, (n_scenarios, n_steps))
+    p = dict((name, np.broadcast_to(value, (n_scenarios,))) for name, value in p.items())
+
+    t_oven = np.empty((n_scenarios, n_steps + 1))
+    t_heat = np.empty((n_scenarios, n_steps + 1))
+    t = np.array(np.broadcast_to(p['t_env'] if t0 is None else t0, (n_scenarios,)), dtype=float)
+    t_h = t.copy()
+    t_oven[:, 0] = t
+    t_heat[:, 0] = t_h
+
+    if method == "exact":
+        # one discretization per scenario, then a matrix-vector step per column
+        coefficients = []
+        for i in range(n_scenarios):
+            phi, g_env, g_heat = ExactStep(dict((name, float(value[i])) for name, value in p.items())).matrices(dt)
+            coefficients.append(phi[0] + phi[1] + g_env + g_heat)
+        (p00, p01, p10, p11, e0, e1, h0, h1) = np.array(coefficients).T
+        for i in range(n_steps):
+            level = duty[:, i]
+            t, t_h = p00 * t + p01 * t_h + e0 + h0 * level, p10 * t + p11 * t_h + e1 + h1 * level
+            t_oven[:, i + 1] = t
+            t_heat[:, i + 1] = t_h
+        return t_oven, t_heat
+
+    # per step constants
+    heat_gain = p['p_heat'] * dt / p['c_heat']
+    ho_oven = dt / (p['R_ho_noair'] * p['c_oven'])
+    ho_heat = dt / (p['R_ho_noair'] * p['c_heat'])
+    env_oven = dt / (p['R_o_nocool'] * p['c_oven'])
+    t_env = p['t_env']
+
+    for i in range(n_steps):
+        # heat element gets the heater energy first, as in TempSensorSimulate
+        t_h = t_h + heat_gain * duty[:, i]
+        p_ho = t_h - t
+        t = t + p_ho * ho_oven
+        t_h = t_h - p_ho * ho_heat
+        t = t - (t - t_env) * env_oven
+        t_oven[:, i + 1] = t
+        t_heat[:, i + 1] = t_h
+
+    return t_oven, t_heat
@@ -0,0 +1,127 @@
+import os
+import json
+import random
+import logging
+import itertools
+import concurrent.futures
+
+from oven2 import Profile
+from simulation import Simulation
+
+log = logging.getLogger(__name__)
+
+# |temperature - target| band (degrees) a hold counts as settled in
+settle_band = 2
+# shortest stretch of constant target (s) that counts as a hold
+min_hold = 300
+# metrics ranked for the overall score, lower is better for all of them
+METRICS = ['overshoot', 'rms_error', 'settling', 'energy']
+
+
+def grid(kp_values, ki_values, kd_values):
+    '''Every (kp, ki, kd) combination of the given values.'''
+    return list(itertools.product(kp_values, ki_values, kd_values))
+
+
+def random_gains(n, kp_range, ki_range, kd_range, seed=None):
+    '''n (kp, ki, kd) sets drawn uniformly from the (min, max) ranges.'''
+    rng = random.Random(seed)
+    return [(rng.uniform(*kp_range), rng.uniform(*ki_range), rng.uniform(*kd_range)) for i in range(n)]
+
+
+def trace_metrics(trace):
+    '''Scores a list of oven states from a firing.
+
+    - overshoot: largest temperature above a rising or constant target
+                 (degrees), counted once the kiln has first been at or below
+                 target; it can't be blamed for starting warm or cooling slowly
+    - rms_error: root mean square of temperature - target (degrees)
+    - settling:  mean time (s) from the start of each hold (target constant
+                 for at least min_hold) until the temperature stays within
+                 settle_band of it; holds that start with the kiln too hot
+                 only measure how fast it cools and are left out
+    '''
+    errors = [state['temperature'] - state['target'] for state in trace]
+    reached = next((i for i, e in enumerate(errors) if e <= 0), len(errors))
+    overshoot = max([0.0] + [errors[i] for i in range(max(reached, 1), len(trace))
+                             if trace[i]['target'] >= trace[i - 1]['target']])
+    rms_error = (sum(e * e for e in errors) / len(errors)) ** 0.5 if errors else 0.0
+
+    settling = []
+    start = 0
+    for i in range(1, len(trace) + 1):
+        if i < len(trace) and trace[i]['target'] == trace[start]['target']:
+            continue
+        if trace[i - 1]['runtime'] - trace[start]['runtime'] >= min_hold and errors[start] <= settle_band:
+            # a hold from start to i - 1
+            unsettled = [j for j in range(start, i) if abs(errors[j]) > settle_band]
+            if unsettled:
+                end = min(unsettled[-1] + 1, i - 1)
+                settling.append(trace[end]['runtime'] - trace[start]['runtime'])
+            else:
+                settling.append(0.0)
+        start = i
+
+    return {
+        'overshoot': overshoot,
+        'rms_error': rms_error,
+        'settling': sum(settling) / len(settling) if settling else 0.0,
+    }
+
+
+def evaluate(profile_json, gains):
+    '''Simulates one firing of profile_json with gains, returns its metrics.'''
+    logging.disable(logging.WARNING)
+    simulation = Simulation(Profile(profile_json), gains=gains)
+    trace = list(simulation.run())
+    metrics = trace_metrics(trace)
+    metrics['energy'] = simulation.energy()
+    metrics['duration'] = trace[-1]['runtime'] if trace else 0.0
+    return metrics
+
+
+def sweep(gain_sets, profiles, workers=None):
+    '''Simulates every gain set on every profile (JSON strings) in a process pool.
+
+    Returns one entry per gain set, metrics averaged over the profiles, sorted
+    best first by the mean of its ranks in METRICS.
+    '''
+    jobs = [(gains, profile_json) for gains in gain_sets for profile_json in profiles]
+    totals = dict((gains, {}) for gains in gain_sets)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = dict((pool.submit(evaluate, profile_json, gains), gains) for gains, profile_json in jobs)
+        for future in concurrent.futures.as_completed(futures):
+            gains = futures[future]
+            for name, value in future.result().items():
+                totals[gains][name] = totals[gains].get(name, 0.0) + value / len(profiles)
+
+    results = [{'gains': gains, 'metrics': metrics} for gains, metrics in totals.items()]
+    for name in METRICS:
+        for rank, result in enumerate(sorted(results, key=lambda r: r['metrics'][name])):
+            result.setdefault('ranks', []).append(rank + 1)
+    for result in results:
+        result['score'] = sum(result['ranks']) / float(len(METRICS))
+    results.sort(key=lambda r: r['score'])
+    return results
+
+
+def report(results, top=10):
+    '''Formats the best results of sweep() as a text table.'''
+    lines = ["%6s %6s %6s  %9s %9s %9s %8s %6s" % (
+        "kp", "ki", "kd", "overshoot", "rms err", "settle s", "kWh", "score")]
+    for result in results[:top]:
+        m = result['metrics']
+        lines.append("%6.3f %6.3f %6.3f  %9.1f %9.1f %9.0f %8.2f %6.1f" % (
+            result['gains'] + (m['overshoot'], m['rms_error'], m['settling'], m['energy'], result['score'])))
+    return "\n".join(lines)
+
+
+def load_profiles(path, names=None):
+    '''JSON strings of the profiles stored in path, optionally only the named ones.'''
+    profiles = []
+    for filename in sorted(os.listdir(path)):
+        with open(os.path.join(path, filename), 'r') as f:
+            obj = json.load(f)
+        if not names or obj['name'] in names:
+            profiles.append(json.dumps(obj))
+    return profiles
@@ -0,0 +1,132 @@
+import math
+from array import array
+
+try:
+    import numpy as np
+
+    numpy_available = True
+except ImportError:
+    numpy_available = False
+
+# The MAX31855 assumes a constant type K sensitivity (mV per degree C), the
+# real curve bends away from it by tens of degrees at stoneware temperatures.
+SENSITIVITY = 0.041276
+
+# NIST ITS-90 type K reference functions, emf in mV, temperature in degrees C
+EMF_BELOW_0 = [0.0, 0.394501280250e-01, 0.236223735980e-04, -0.328589067840e-06, -0.499048287770e-08,
+               -0.675090591730e-10, -0.574103274280e-12, -0.310888728940e-14, -0.104516093650e-16,
+               -0.198892668780e-19, -0.163226974860e-22]
+EMF_ABOVE_0 = [-0.176004136860e-01, 0.389212049750e-01, 0.185587700320e-04, -0.994575928740e-07,
+               0.318409457190e-09, -0.560728448890e-12, 0.560750590590e-15, -0.320207200030e-18,
+               0.971511471520e-22, -0.121047212750e-25]
+EMF_EXP = (0.118597600000e+00, -0.118343200000e-03, 0.126968600000e+03)
+# inverse functions by emf range (mV): (lower bound, coefficients)
+INVERSE = [
+    (-5.891, [0.0, 2.5173462e+01, -1.1662878e+00, -1.0833638e+00, -8.9773540e-01, -3.7342377e-01,
+              -8.6632643e-02, -1.0450598e-02, -5.1920577e-04]),
+    (0.0, [0.0, 2.508355e+01, 7.860106e-02, -2.503131e-01, 8.315270e-02, -1.228034e-02, 9.804036e-04,
+           -4.413030e-05, 1.057734e-06, -1.052755e-08]),
+    (20.644, [-1.318058e+02, 4.830222e+01, -1.646031e+00, 5.464731e-02, -9.650715e-04, 8.802193e-06,
+              -3.110810e-08]),
+]
+
+# Lookup tables, linearly interpolated on a uniform grid:
+# emf -> temperature over the range of the inverse functions
+EMF_MIN = -5.891
+EMF_MAX = 54.886
+EMF_STEP = 0.01
+# reference junction temperature -> emf over the range the MAX31855 reports
+RJ_MIN = -60.0
+RJ_MAX = 130.0
+RJ_STEP = 0.5
+
+
+def polynomial(coefficients, x):
+    result = 0.0
+    for c in reversed(coefficients):
+        result = result * x + c
+    return result
+
+
+def emf(t):
+    '''Thermocouple emf (mV) of a type K junction at t degrees C against 0 degrees C.'''
+    if t < 0:
+        return polynomial(EMF_BELOW_0, t)
+    a0, a1, a2 = EMF_EXP
+    return polynomial(EMF_ABOVE_0, t) + a0 * math.exp(a1 * (t - a2) ** 2)
+
+
+def inverse_emf(e):
+    '''Temperature (degrees C) for a type K emf (mV) against 0 degrees C, NIST inverse polynomials.'''
+    coefficients = INVERSE[0][1]
+    for lower, c in INVERSE:
+        if e >= lower:
+            coefficients = c
+    return polynomial(coefficients, e)
+
+
+def build_table(function, start, stop, step):
+    n = int(round((stop - start) / step)) + 1
+    return array('d', [function(start + i * step) for i in range(n)])
+
+
+_tables = None
+
+
+def tables():
+    '''(temperature table, reference junction emf table), built on first use.'''
+    global _tables
+    if _tables is None:
+        _tables = (build_table(inverse_emf, EMF_MIN, EMF_MAX, EMF_STEP),
+                   build_table(emf, RJ_MIN, RJ_MAX, RJ_STEP))
+    return _tables
+
+
+def interpolate(table, start, step, x):
+    '''Linear interpolation in a table sampled every step from start, clamped to its ends.'''
+    position = (x - start) / step
+    if position <= 0:
+        return table[0]
+    i = int(position)
+    if i >= len(table) - 1:
+        return table[-1]
+    return table[i] + (table[i + 1] - table[i]) * (position - i)
+
+
+def linearize(tc, rj):
+    '''Hot junction temperature (C) from the MAX31855's linear thermocouple and reference junction readings (C).
+
+    The chip measured (tc - rj) * SENSITIVITY mV; adding the emf of the
+    reference junction gives the emf against 0 degrees C, which the table
+    turns into a temperature.
+    '''
+    temperatures, rj_emfs = tables()
+    e = (tc - rj) * SENSITIVITY + interpolate(rj_emfs, RJ_MIN, RJ_STEP, rj)
+    return interpolate(temperatures, EMF_MIN, EMF_STEP, e)
+
+
+def linearize_array(tc, rj):
+    '''linearize() for NumPy arrays (or sequences) of readings.'''
+    tc = np.asarray(tc, dtype=float)
+    rj = np.asarray(rj, dtype=float)
+    temperatures, rj_emfs = tables()
+    rj_grid = RJ_MIN + RJ_STEP * np.arange(len(rj_emfs))
+    emf_grid = EMF_MIN + EMF_STEP * np.arange(len(temperatures))
+    e = (tc - rj) * SENSITIVITY + np.interp(rj, rj_grid, np.frombuffer(rj_emfs))
+    return np.interp(e, emf_grid, np.frombuffer(temperatures))
+
+
+def decode_frames(frames):
+    '''Thermocouple and reference junction readings (C) of raw 32 bit MAX31855 frames, as two arrays.'''
+    frames = np.asarray(frames, dtype=np.uint32)
+    # sign extend the 14 bit and 12 bit two's complement fields
+    tc = ((frames >> 18) & 0x3FFF).astype(np.int32)
+    tc = np.where(tc & 0x2000, tc - 0x4000, tc)
+    rj = ((frames >> 4) & 0xFFF).astype(np.int32)
+    rj = np.where(rj & 0x800, rj - 0x1000, rj)
+    return tc * 0.25, rj * 0.0625
+
+
+def linearize_frames(frames):
+    '''Linearized temperatures (C) of raw 32 bit MAX31855 frames, e.g. from a log.'''
+    return linearize_array(*decode_frames(frames))
@@ -14,8 +14,15 @@ var temp_scale_display = "C";
 var kwh_rate = 0.26;
 var currency_type = "AUD";
 
+// status stream: the reassembled state and the sequence number it is at
+var status_state = null;
+var status_seq = null;
+
 var host = "ws://" + window.location.hostname + ":" + window.location.port;
-var ws_status = new WebSocket(host+"/status");
+// the backlog is downsampled to about one point per pixel of the graph
+var ws_status = new WebSocket(host+"/status?format=binary&points=" + Math.min(2000, Math.max(200, window.innerWidth)));
+// binary messages are backlog column frames, see lib/binframe.py
+ws_status.binaryType = "arraybuffer";
 var ws_control = new WebSocket(host+"/control");
 var ws_config = new WebSocket(host+"/config");
 var ws_storage = new WebSocket(host+"/storage");
@@ -49,6 +56,24 @@ graph.movingProfile =
     draggable: false
 };
 
+// Parses a float32 column frame (lib/binframe.py): the metadata object
+// with log set to {field: Float32Array}. The columns are views on the
+// received buffer, little-endian like every browser platform.
+function decodeColumnFrame(buffer)
+{
+    var header = new DataView(buffer, 0, 12);
+    var rows = header.getUint32(4, true);
+    var length = header.getUint32(8, true);
+    var meta = JSON.parse(new TextDecoder("utf-8").decode(new Uint8Array(buffer, 12, length)));
+    var offset = 12 + length;
+    meta.log = {};
+    $.each(meta.fields, function(i, field) {
+        meta.log[field] = new Float32Array(buffer, offset, rows);
+        offset += 4 * rows;
+    });
+    return meta;
+}
+
 function updateProfile(id)
 {
     selected_profile = id;
@@ -561,7 +586,7 @@ $(document).ready(function()
 
         ws_status.onmessage = function(e)
         {
-            x = JSON.parse(e.data);
+            x = (e.data instanceof ArrayBuffer) ? decodeColumnFrame(e.data) : JSON.parse(e.data);
 
             if (x.type == "backlog")
             {
@@ -576,12 +601,33 @@ $(document).ready(function()
                     });
                 }
 
-                $.each(x.log, function(i,v) {
-                    graph.live.data.push([v.runtime, v.temperature]);
-                    graph.movingProfile.data.push([v.runtime, v.target]);
-                    graph.plot = $.plot("#graph_container", [ graph.profile, graph.live ] , getOptions());
-                });
+                // the log comes as columns: {runtime: [...], temperature: [...], ...}
+                for (var i = 0; i < x.log.runtime.length; i++) {
+                    graph.live.data.push([x.log.runtime[i], x.log.temperature[i]]);
+                    graph.movingProfile.data.push([x.log.runtime[i], x.log.target[i]]);
+                }
+                graph.plot = $.plot("#graph_container", [ graph.profile, graph.live ] , getOptions());
+                return;
+            }
+
+            if (x.type == "keyframe")
+            {
+                status_state = x.state;
+                status_seq = x.seq;
+            }
+            else if (x.type == "delta")
+            {
+                // after a gap (messages dropped for a slow client) wait for the next keyframe
+                if (status_seq === null || x.seq != status_seq + 1) { return; }
+                status_seq = x.seq;
+                $.each(x.changes, function(k, v) { status_state[k] = v; });
+                $.each(x.removed, function(i, k) { delete status_state[k]; });
             }
+            else
+            {
+                return;
+            }
+            x = status_state;
 
             if(state!="EDIT")
             {
@@ -694,11 +740,16 @@ $(document).ready(function()
 
         ws_control.onmessage = function(e)
         {
-            //Data from Simulation
-            console.log (e.data);
+            //Data from Simulation, streamed in chunks
             x = JSON.parse(e.data);
-            graph.live.data.push([x.runtime, x.temperature]);
-            graph.plot = $.plot("#graph_container", [ graph.profile, graph.live, graph.movingProfile ] , getOptions());
+            if (x.type == "simulation")
+            {
+                $.each(x.log, function(i,v) {
+                    graph.live.data.push([v.runtime, v.temperature]);
+                    graph.movingProfile.data.push([v.runtime, v.target]);
+                });
+                graph.plot = $.plot("#graph_container", [ graph.profile, graph.live, graph.movingProfile ] , getOptions());
+            }
 
         }
 